@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+ANSWER_CACHE_PATH = os.path.join(os.path.dirname(__file__), "cache", "answers.sqlite")
+THRESHOLD = 0.92  # minimum cosine similarity between questions for a hit
+TTL_SECONDS = 7 * 24 * 3600
+MAX_ENTRIES = 5000
+
+
+class SemanticAnswerCache:
+    """Persistent cache of final answers, looked up by question similarity.
+
+    Each entry holds the question's embedding, its extracted metadata filters
+    and the collection version it was answered against. A lookup hits when a
+    stored question under the same `namespace` (embedding and Claude model),
+    with identical filters and the current collection version, is within
+    `threshold` cosine similarity. Entries expire after `ttl_seconds`; past
+    `max_entries` the least recently used are evicted. Entries from any other
+    collection version are dropped on the next lookup, so re-ingesting
+    invalidates the cache.
+
+    Embeddings are mirrored in memory so a lookup is one matrix-vector
+    product over the whole cache.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        path: str = ANSWER_CACHE_PATH,
+        threshold: float = THRESHOLD,
+        ttl_seconds: float = TTL_SECONDS,
+        max_entries: int = MAX_ENTRIES,
+    ):
+        self.namespace = namespace
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "  id INTEGER PRIMARY KEY,"
+            "  namespace TEXT NOT NULL,"
+            "  collection_version TEXT NOT NULL,"
+            "  filters TEXT NOT NULL,"
+            "  question TEXT NOT NULL,"
+            "  embedding BLOB NOT NULL,"
+            "  analysis TEXT NOT NULL,"
+            "  response TEXT NOT NULL,"
+            "  created REAL NOT NULL,"
+            "  last_used REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._conn.commit()
+        self._load()
+
+    def _load(self) -> None:
+        rows = self._conn.execute(
+            "SELECT id, collection_version, filters, embedding, created FROM answers WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchall()
+        self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self._versions = [row[1] for row in rows]
+        self._filters = np.array([row[2] for row in rows], dtype=object)
+        self._created = np.array([row[4] for row in rows], dtype=np.float64)
+        self._matrix = (
+            np.stack([np.frombuffer(row[3], dtype=np.float32) for row in rows])
+            if rows else np.empty((0, 0), dtype=np.float32)
+        )
+
+    def _purge(self, collection_version: str) -> None:
+        stale = [
+            int(entry_id)
+            for entry_id, version, created in zip(self._ids, self._versions, self._created)
+            if version != collection_version or created < time.time() - self.ttl_seconds
+        ]
+        if stale:
+            self._conn.executemany("DELETE FROM answers WHERE id = ?", [(entry_id,) for entry_id in stale])
+            self._conn.commit()
+            self._load()
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, embedding, filters: str, collection_version: str) -> dict | None:
+        """Return {question, analysis, response, similarity} for the closest
+        cached question within the threshold, or None."""
+        with self._lock:
+            self._purge(collection_version)
+            best = None
+            if len(self._ids):
+                similarities = self._matrix @ self._unit(embedding)
+                similarities[self._filters != filters] = -np.inf
+                candidate = int(np.argmax(similarities))
+                if similarities[candidate] >= self.threshold:
+                    best = candidate
+            if best is None:
+                self.misses += 1
+                return None
+
+            entry_id = int(self._ids[best])
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+            self._conn.commit()
+            question, analysis, response = self._conn.execute(
+                "SELECT question, analysis, response FROM answers WHERE id = ?", (entry_id,)
+            ).fetchone()
+            self.hits += 1
+            return {
+                "question": question,
+                "analysis": analysis,
+                "response": response,
+                "similarity": float(similarities[best]),
+            }
+
+    def store(self, question: str, embedding, filters: str, collection_version: str, analysis: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (namespace, collection_version, filters, question, embedding, analysis,"
+                " response, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.namespace, collection_version, filters, question, self._unit(embedding).tobytes(),
+                 analysis, response, now, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM answers WHERE id IN ("
+                    "  SELECT id FROM answers ORDER BY last_used ASC LIMIT ?"
+                    ")",
+                    (overflow,),
+                )
+            self._conn.commit()
+            self._load()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._ids),
+        }
+
+    def close(self) -> None:
+        self._conn.close()
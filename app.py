@@ -1,16 +1,32 @@
 import streamlit as st
 import pandas as pd
 import time
+import json
+from concurrent.futures import ThreadPoolExecutor
 
+from context_builder import build_context
 from main import (
-    get_embedder,
-    get_collection,
-    get_anthropic,
-    CLAUDE_MODEL,
-    TOP_K,
+    answer_cache_lookup_node,
+    answer_cache_store_node,
+    CONTEXT_TOKEN_BUDGET,
+    expand_log_ids,
+    extract_filters,
+    get_query_cache,
+    hybrid_search,
+    merge_chunks,
+    raw_results_confident,
+    SKIP_REWRITE_DISTANCE,
+    SPECULATIVE_RETRIEVAL,
+    get_llm_cache,
+    call_claude,
+    stream_claude,
+    token_usage_summary,
     REWRITE_PROMPT,
+    REWRITE_SYSTEM,
     KNOWLEDGE_PROMPT,
+    KNOWLEDGE_SYSTEM,
     RESPONSE_PROMPT,
+    RESPONSE_SYSTEM,
 )
 
 # ---------------------------------------------------------------------------
@@ -155,6 +171,20 @@ def safe_markdown(text: str):
     st.markdown(cleaned, unsafe_allow_html=True)
 
 
+def stream_markdown(chunks) -> str:
+    """Render text as it streams in, escaped like `safe_markdown`, and return
+    the unescaped text once the stream ends."""
+    parts = []
+
+    def escaped():
+        for text in chunks:
+            parts.append(text)
+            yield text.replace("<", "&lt;").replace(">", "&gt;")
+
+    st.write_stream(escaped())
+    return "".join(parts)
+
+
 def render_pipeline(active: int = -1, done_up_to: int = -1):
     """Render the 3-box pipeline. active = index currently running, done_up_to = last completed."""
     cols = st.columns([3, 1, 3, 1, 3])
@@ -191,6 +221,7 @@ def render_chunk_card(idx: int, chunk: dict):
     equipment = meta.get("equipment_type", "Unknown")
     chunk_type = meta.get("chunk_type", "unknown")
     distance = chunk["distance"]
+    log_count = meta.get("occurrences") or len(expand_log_ids(meta))
     text_preview = chunk["text"][:300] + ("..." if len(chunk["text"]) > 300 else "")
 
     st.markdown(
@@ -200,6 +231,7 @@ def render_chunk_card(idx: int, chunk: dict):
         f'    <span>\U0001f699 {equipment}</span>'
         f'    <span class="{sev_class}">\u26a0 {sev.title()}</span>'
         f'    <span>\U0001f4c4 {chunk_type}</span>'
+        f'    <span>\U0001f4cb {log_count} log{"s" if log_count != 1 else ""}</span>'
         f'    <span>\U0001f3af Distance: {distance:.4f}</span>'
         f'  </div>'
         f'  <div class="chunk-text">{text_preview}</div>'
@@ -211,7 +243,7 @@ def render_chunk_card(idx: int, chunk: dict):
 # ---------------------------------------------------------------------------
 # Session state init
 # ---------------------------------------------------------------------------
-for key in ("stage", "rewritten_query", "chunks", "analysis", "response"):
+for key in ("stage", "rewritten_query", "chunks", "analysis", "response", "cached_question"):
     if key not in st.session_state:
         st.session_state[key] = None if key != "stage" else "idle"
 if "query_count" not in st.session_state:
@@ -280,44 +312,72 @@ elif run_clicked and query.strip():
     st.session_state.analysis = None
     st.session_state.response = None
 
+    # A near-identical question answered earlier skips all three agents
+    # The app always runs the full pipeline, so it shares that profile's answers
+    cached = answer_cache_lookup_node({"original_query": query}, {"configurable": {"profile": "full"}})
+    st.session_state.cached_question = cached["cached_question"] or None
+    if st.session_state.cached_question:
+        st.session_state.analysis = cached["knowledge_analysis"]
+        st.session_state.response = cached["final_response"]
+        st.session_state.stage = "done"
+        st.rerun()
+
     # --- Agent 1: Retrieval (query rewrite + vector search) ---
     with pipeline_placeholder.container():
         render_pipeline(active=0)
 
     agent1_exp = st.expander("\U0001f50d Agent 1 \u2014 Retrieval", expanded=True)
-    agent2_exp = st.expander("\U0001f9e0 Agent 2 \u2014 Knowledge Extraction", expanded=False)
-    agent3_exp = st.expander("\U0001f4ac Agent 3 \u2014 Response Synthesis", expanded=False)
+    # Open so the analysis and response can be watched as they stream in
+    agent2_exp = st.expander("\U0001f9e0 Agent 2 \u2014 Knowledge Extraction", expanded=True)
+    agent3_exp = st.expander("\U0001f4ac Agent 3 \u2014 Response Synthesis", expanded=True)
 
     with agent1_exp:
-        with st.spinner("Rewriting query for vector search..."):
-            response = get_anthropic().messages.create(
-                model=CLAUDE_MODEL,
-                max_tokens=256,
-                messages=[{"role": "user", "content": REWRITE_PROMPT.format(query=query)}],
+        filters = extract_filters(query)
+        applied = [filters]  # filter the searches actually ran with, once relaxed
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            # Retrieve on the raw question while the rewrite is in flight
+            raw_future = (
+                pool.submit(hybrid_search, query, filters, applied_wheres=applied) if SPECULATIVE_RETRIEVAL else None
             )
-            rewritten = response.content[0].text.strip()
+            skip_rewrite = (
+                raw_future is not None
+                and SKIP_REWRITE_DISTANCE is not None
+                and raw_results_confident(raw_future.result())
+            )
+            if skip_rewrite:
+                rewritten = ""
+            else:
+                with st.spinner("Rewriting query for vector search..."):
+                    rewritten = call_claude(
+                        REWRITE_PROMPT.format(query=query), max_tokens=256, system=REWRITE_SYSTEM
+                    ).strip()
             st.session_state.rewritten_query = rewritten
+            raw_chunks = raw_future.result() if raw_future is not None else []
 
         st.markdown(f"**Rewritten Query:**")
-        st.code(rewritten, language=None)
+        st.code(rewritten or "(skipped \u2014 results for the original question were already close matches)", language=None)
 
         with st.spinner("Searching vector database..."):
-            embedding = get_embedder().encode([rewritten])[0].tolist()
-            results = get_collection().query(
-                query_embeddings=[embedding],
-                n_results=TOP_K,
-                include=["documents", "metadatas", "distances"],
-            )
-            chunks = []
-            for doc, meta, dist in zip(
-                results["documents"][0],
-                results["metadatas"][0],
-                results["distances"][0],
-            ):
-                chunks.append({"text": doc, "metadata": meta, "distance": dist})
+            if rewritten:
+                chunks = merge_chunks(
+                    raw_chunks,
+                    hybrid_search(rewritten, filters, lexical_query=f"{query} {rewritten}", applied_wheres=applied),
+                )
+            else:
+                chunks = raw_chunks
             st.session_state.chunks = chunks
 
+        if filters:
+            st.markdown("**Metadata filters:**")
+            st.code(json.dumps(applied[0] or {}), language="json")
+            if applied[0] != filters:
+                st.caption(f"Relaxed from {json.dumps(filters)}, which matched nothing")
         st.markdown(f"**Retrieved {len(chunks)} chunks** from maintenance knowledge base")
+        cache_stats = get_query_cache().stats()
+        st.caption(
+            f"Query embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%} hit rate)"
+        )
         st.markdown("")
         for i, chunk in enumerate(chunks, 1):
             render_chunk_card(i, chunk)
@@ -327,59 +387,53 @@ elif run_clicked and query.strip():
         render_pipeline(active=1, done_up_to=0)
 
     with agent2_exp:
-        with st.spinner("Analyzing maintenance patterns..."):
-            chunks_text = ""
-            for i, chunk in enumerate(chunks, 1):
-                meta = chunk["metadata"]
-                chunks_text += (
-                    f"\n--- Chunk {i} (type: {meta.get('chunk_type', 'unknown')}, "
-                    f"equipment: {meta.get('equipment_type', 'unknown')}, "
-                    f"severity: {meta.get('severity', 'unknown')}, "
-                    f"distance: {chunk['distance']:.4f}) ---\n"
-                    f"{chunk['text']}\n"
-                )
-            prompt = KNOWLEDGE_PROMPT.format(query=rewritten, chunks=chunks_text)
-            response = get_anthropic().messages.create(
-                model=CLAUDE_MODEL,
-                max_tokens=2048,
-                messages=[{"role": "user", "content": prompt}],
-            )
-            analysis = response.content[0].text
-            st.session_state.analysis = analysis
+        chunks_text, kept = build_context(chunks, CONTEXT_TOKEN_BUDGET)
+        prompt = KNOWLEDGE_PROMPT.format(query=rewritten or query, chunks=chunks_text)
+        if kept < len(chunks):
+            st.caption(f"Context budget: analysing the top {kept} of {len(chunks)} chunks")
 
-        safe_markdown(analysis)
+        analysis = stream_markdown(stream_claude(prompt, max_tokens=2048, system=KNOWLEDGE_SYSTEM))
+        st.session_state.analysis = analysis
 
     # --- Agent 3: Response Synthesis ---
     with pipeline_placeholder.container():
         render_pipeline(active=2, done_up_to=1)
 
     with agent3_exp:
-        with st.spinner("Generating engineer response..."):
-            response = get_anthropic().messages.create(
-                model=CLAUDE_MODEL,
-                max_tokens=2048,
-                messages=[{"role": "user", "content": RESPONSE_PROMPT.format(
-                    query=query, analysis=analysis
-                )}],
+        final_response = stream_markdown(
+            stream_claude(
+                RESPONSE_PROMPT.format(query=query, analysis=analysis), max_tokens=2048, system=RESPONSE_SYSTEM
             )
-            final_response = response.content[0].text
-            st.session_state.response = final_response
-
-        safe_markdown(final_response)
+        )
+        st.session_state.response = final_response
 
     # --- Done ---
     with pipeline_placeholder.container():
         render_pipeline(done_up_to=2)
 
     st.success("Pipeline complete \u2014 all 3 agents finished successfully.")
+    llm_stats = get_llm_cache().stats()
+    st.caption(
+        f"Claude call cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses "
+        f"({llm_stats['hit_rate']:.0%} hit rate)"
+    )
+    st.caption(token_usage_summary())
 
+    answer_cache_store_node({
+        "original_query": query,
+        "knowledge_analysis": analysis,
+        "final_response": final_response,
+    }, {"configurable": {"profile": "full"}})
     st.session_state.stage = "done"
 
 # ---------------------------------------------------------------------------
 # Show previous results if page rerenders
 # ---------------------------------------------------------------------------
 elif st.session_state.stage == "done":
-    st.success("Pipeline complete \u2014 all 3 agents finished successfully.")
+    if st.session_state.cached_question:
+        st.info(f"Answered from cache \u2014 a similar question was asked before: \"{st.session_state.cached_question}\"")
+    else:
+        st.success("Pipeline complete \u2014 all 3 agents finished successfully.")
 
     agent1_exp = st.expander("\U0001f50d Agent 1 \u2014 Retrieval", expanded=False)
     agent2_exp = st.expander("\U0001f9e0 Agent 2 \u2014 Knowledge Extraction", expanded=False)
@@ -0,0 +1,196 @@
+"""Ingest benchmark: per-stage throughput, wall time and peak memory over
+synthetic corpora of several sizes.
+
+Each run calls `ingest.ingest` itself against a temporary vector store, so the
+wall time, peak RSS and encode/write throughput are those of the real
+pipeline (windowing, caching off, lexical index and sidecar included). Load
+and chunk micro-timings and the model load time are measured separately
+afterwards.
+
+    python benchmark.py --sizes 100 1000 10000
+    python benchmark.py --sizes 1000 --compare benchmarks/ingest_20250101-120000.json
+
+Each corpus size runs in a fresh process so its peak RSS is measured in
+isolation. Set EMBEDDING_BACKEND to benchmark the ONNX or int8 embedders.
+Runs fully offline: the embedding model must already be in the local
+Hugging Face cache.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from embedder import EMBEDDING_BACKEND
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(__file__), "benchmarks")
+DEFAULT_SIZES = [100, 1000, 10000]
+REGRESSION_THRESHOLD = 0.10  # flag stages more than 10% slower than the baseline
+STAGES = ("encode", "write")  # ingest's own per-stage counters
+MICRO_STAGES = ("load", "chunk")
+
+
+def _peak_rss_mb() -> float:
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _rates(stages: dict, num_chunks: int) -> dict:
+    return {
+        name: {
+            "seconds": round(stage["seconds"], 4),
+            "chunks_per_sec": round(num_chunks / stage["seconds"], 1) if stage["seconds"] else None,
+        }
+        for name, stage in stages.items()
+    }
+
+
+def _run_size(num_logs: int, window_size: int, encode_batch_size: int, write_batch_size: int) -> dict:
+    """Benchmark `ingest.ingest` over one generated corpus (runs in a child process)."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    import generate_data
+    import ingest
+    from embedder import load_embedder
+
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus_path = os.path.join(workdir, "logs.jsonl")
+        generate_data.write_sharded_jsonl(corpus_path, num_logs, shard_size=max(1, min(10_000, num_logs)), workers=1)
+
+        ingest.VECTORSTORE_PATH = os.path.join(workdir, "vectorstore")
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = ingest.ingest(
+                data_path=corpus_path,
+                window_size=window_size,
+                encode_batch_size=encode_batch_size,
+                write_batch_size=write_batch_size,
+                use_cache=False,
+            )
+        # Read before the micro-timings, which hold the whole corpus in memory
+        peak_rss_mb = _peak_rss_mb()
+
+        micro = {}
+        start = time.perf_counter()
+        logs = list(ingest.iter_logs(corpus_path))
+        micro["load"] = {"seconds": time.perf_counter() - start}
+        start = time.perf_counter()
+        list(ingest.iter_chunks(logs))
+        micro["chunk"] = {"seconds": time.perf_counter() - start}
+        del logs
+
+    start = time.perf_counter()
+    load_embedder()
+    model_load_seconds = time.perf_counter() - start
+
+    num_chunks = report["chunks"]
+    return {
+        "num_logs": num_logs,
+        "num_chunks": num_chunks,
+        "stages": _rates(report["stages"], num_chunks),
+        "wall_seconds": round(report["wall_seconds"], 4),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "micro_stages": _rates(micro, num_chunks),
+        "model_load_seconds": round(model_load_seconds, 4),
+    }
+
+
+def run_benchmark(sizes: list[int], window_size: int, encode_batch_size: int, write_batch_size: int) -> dict:
+    # Never reach for the network: the local model cache must already be populated
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+    runs = []
+    for num_logs in sizes:
+        print(f"Benchmarking {num_logs} logs...")
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            run = pool.submit(_run_size, num_logs, window_size, encode_batch_size, write_batch_size).result()
+        print_run(run)
+        runs.append(run)
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "embedding_backend": EMBEDDING_BACKEND,
+        "window_size": window_size,
+        "encode_batch_size": encode_batch_size,
+        "write_batch_size": write_batch_size,
+        "runs": runs,
+    }
+
+
+def print_run(run: dict):
+    print(f"  {run['num_logs']} logs → {run['num_chunks']} chunks")
+    print(f"    ingest wall {run['wall_seconds']:.3f}s, peak RSS {run['peak_rss_mb']:.1f} MB")
+    for name in STAGES:
+        stage = run["stages"][name]
+        print(f"    {name:<7} {stage['seconds']:8.3f}s busy  {stage['chunks_per_sec'] or 0:>12,.1f} chunks/sec")
+    print("    micro-timings:")
+    for name in MICRO_STAGES:
+        stage = run["micro_stages"][name]
+        print(f"    {name:<7} {stage['seconds']:8.3f}s       {stage['chunks_per_sec'] or 0:>12,.1f} chunks/sec")
+    print(f"    model load {run['model_load_seconds']:.3f}s (also inside ingest's encode time)")
+
+
+def compare(results: dict, baseline: dict) -> bool:
+    """Print per-stage throughput against a baseline run. Returns True if any stage regressed."""
+    baseline_runs = {run["num_logs"]: run for run in baseline["runs"]}
+    regressed = False
+    print(f"Comparison against baseline from {baseline['timestamp']}:")
+    for run in results["runs"]:
+        base = baseline_runs.get(run["num_logs"])
+        if base is None:
+            continue
+        for name in STAGES:
+            new_rate = run["stages"][name]["chunks_per_sec"]
+            old_rate = base["stages"].get(name, {}).get("chunks_per_sec")
+            if not new_rate or not old_rate:
+                continue
+            change = new_rate / old_rate - 1
+            flag = ""
+            if change < -REGRESSION_THRESHOLD:
+                flag = "  REGRESSION"
+                regressed = True
+            print(f"  {run['num_logs']:>8} logs  {name:<7} {change:+7.1%}{flag}")
+        wall_change = run["wall_seconds"] / base["wall_seconds"] - 1
+        print(f"  {run['num_logs']:>8} logs  wall     {wall_change:+7.1%}")
+        rss_change = run["peak_rss_mb"] / base["peak_rss_mb"] - 1
+        print(f"  {run['num_logs']:>8} logs  peak RSS {rss_change:+7.1%}")
+    return regressed
+
+
+if __name__ == "__main__":
+    from ingest import ENCODE_BATCH_SIZE, WINDOW_SIZE, WRITE_BATCH_SIZE
+
+    parser = argparse.ArgumentParser(description="Benchmark the ingest pipeline stage by stage.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Corpus sizes in logs.")
+    parser.add_argument("--window-size", type=int, default=WINDOW_SIZE)
+    parser.add_argument("--encode-batch-size", type=int, default=ENCODE_BATCH_SIZE)
+    parser.add_argument("--write-batch-size", type=int, default=WRITE_BATCH_SIZE)
+    parser.add_argument("--output", help="Results file (default: benchmarks/ingest_<timestamp>.json).")
+    parser.add_argument("--compare", metavar="BASELINE", help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.window_size, args.encode_batch_size, args.write_batch_size)
+
+    output = args.output or os.path.join(BENCHMARK_DIR, f"ingest_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            if compare(results, json.load(f)):
+                sys.exit(1)
@@ -0,0 +1,98 @@
+import re
+
+TOKEN_BUDGET = 2000
+CHARS_PER_TOKEN = 4  # rough English average for Claude's tokenizer
+MAX_HEADER_IDS = 3  # log / equipment ids listed in a group header before "(+K more)"
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _log_key(meta: dict) -> str:
+    return meta.get("log_ids") or meta["log_id"]
+
+
+def _prefix_patterns(meta: dict) -> list[tuple[re.Pattern, str]]:
+    """(pattern, replacement) pairs for the per-chunk prefixes `ingest.chunk_log`
+    writes. Each pattern captures the fault description; the rest of the
+    prefix (equipment, id, date, severity) is already in the group header."""
+    equipment = re.escape(meta.get("equipment_type", ""))
+    equipment_id = re.escape(meta.get("equipment_id", ""))
+    return [
+        (re.compile(
+            rf"^Equipment: {equipment} \({equipment_id}\)\. Date: {re.escape(meta.get('date', ''))}\. "
+            rf"Severity: \w+\. Fault: (?P<fault>.+?)\. (?=Symptoms: )"
+        ), ""),
+        (re.compile(rf"^Fault: (?P<fault>.+?) on {equipment}\. "), ""),
+        (re.compile(rf"^Engineer notes for (?P<fault>.+?) on {equipment} \({equipment_id}\): "), "Engineer notes: "),
+    ]
+
+
+def _compact(chunk: dict) -> tuple[str | None, str]:
+    """(fault description, chunk text without its repeated prefix), or
+    (None, text) when the text doesn't start with a known prefix."""
+    text = chunk["text"]
+    for pattern, replacement in _prefix_patterns(chunk["metadata"]):
+        match = pattern.match(text)
+        if match:
+            return match["fault"], replacement + text[match.end():]
+    return None, text
+
+
+def _id_list(ids: list[str], total: int) -> str:
+    listed = ", ".join(ids[:MAX_HEADER_IDS])
+    more = total - min(len(ids), MAX_HEADER_IDS)
+    return f"{listed} (+{more} more)" if more > 0 else listed
+
+
+def _header(meta: dict, fault: str | None) -> str:
+    log_ids = _log_key(meta).split(",")
+    total = max(meta.get("occurrences") or 0, len(log_ids))
+    logs = f"Log {log_ids[0]}" if total == 1 else f"{total} logs: {_id_list(log_ids, total)}"
+    equipment_ids = (meta.get("equipment_ids") or meta.get("equipment_id") or "unknown").split(",")
+    equipment_ids = _id_list(equipment_ids, len(equipment_ids))
+    header = (
+        f"\n--- {logs} | {meta.get('equipment_type', 'unknown')} ({equipment_ids}) | "
+        f"{meta.get('date', 'unknown')} | severity: {meta.get('severity', 'unknown')} ---\n"
+    )
+    return header + (f"Fault: {fault}\n" if fault else "")
+
+
+def build_context(chunks: list[dict], token_budget: int | None = TOKEN_BUDGET) -> tuple[str, int]:
+    """Render ranked chunks as compact prompt context within `token_budget`.
+
+    Chunks are grouped by log, groups ordered by their best-ranked chunk. Each
+    group gets one header with the log's equipment, date, severity and fault,
+    and its chunks drop the "Fault: ... on <equipment>." style prefix that
+    header repeats. Chunks are admitted in rank order until the next one (with
+    its group header, if new) would exceed the budget, so only the
+    lowest-ranked are dropped; the top chunk is always kept. Token counts are
+    estimated at CHARS_PER_TOKEN characters per token. Returns the context and
+    the number of chunks it holds.
+    """
+    groups: dict[str, dict] = {}
+    used = 0
+    for rank, chunk in enumerate(chunks):
+        key = _log_key(chunk["metadata"])
+        fault, text = _compact(chunk)
+        group = groups.get(key)
+        if group is not None and fault != group["fault"]:
+            # The group header doesn't carry this prefix's fault; keep it verbatim
+            text = chunk["text"]
+        line = f"- {text}\n"
+
+        cost = estimate_tokens(line)
+        if group is None:
+            cost += estimate_tokens(_header(chunk["metadata"], fault))
+        if rank and token_budget is not None and used + cost > token_budget:
+            break
+        used += cost
+
+        if group is None:
+            groups[key] = {"meta": chunk["metadata"], "fault": fault, "lines": [line]}
+        else:
+            group["lines"].append(line)
+
+    context = "".join(_header(group["meta"], group["fault"]) + "".join(group["lines"]) for group in groups.values())
+    return context, sum(len(group["lines"]) for group in groups.values())
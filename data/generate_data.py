@@ -1,8 +1,11 @@
+import argparse
 import json
+import multiprocessing
+import os
 import random
 from datetime import datetime, timedelta
 
-random.seed(42)
+SEED = 42
 
 EQUIPMENT_TYPES = [
     {"id_prefix": "TRK", "type": "Heavy Utility Truck"},
@@ -234,17 +237,22 @@ ENGINEER_NOTES_TEMPLATES = [
 ]
 
 
-def generate_engineer_note(equipment_type, fault_category):
-    template = random.choice(ENGINEER_NOTES_TEMPLATES)
+def generate_engineer_note(equipment_type, fault_category, rng=random):
+    template = rng.choice(ENGINEER_NOTES_TEMPLATES)
     return template.format(
-        days=random.choice([30, 60, 90]),
-        equip=random.choice([e["type"] for e in EQUIPMENT_TYPES]),
-        weeks=random.choice([1, 2, 3, 4]),
+        days=rng.choice([30, 60, 90]),
+        equip=rng.choice([e["type"] for e in EQUIPMENT_TYPES]),
+        weeks=rng.choice([1, 2, 3, 4]),
         system=fault_category,
     )
 
 
-def generate_logs(num_logs=75):
+def generate_logs(num_logs=75, seed=SEED, first_log_num=1, id_width=4):
+    """Generate `num_logs` logs from a private RNG seeded with `seed`.
+
+    Log ids are numbered from `first_log_num`, zero-padded to `id_width` digits.
+    """
+    rng = random.Random(seed)
     logs = []
     start_date = datetime(2024, 1, 1)
     fault_categories = list(FAULT_TEMPLATES.keys())
@@ -257,25 +265,25 @@ def generate_logs(num_logs=75):
         # Pick category, favouring underrepresented ones
         min_count = min(category_counts.values())
         candidates = [c for c, v in category_counts.items() if v <= min_count + 2]
-        category = random.choice(candidates)
+        category = rng.choice(candidates)
         category_counts[category] += 1
 
         templates = FAULT_TEMPLATES[category]
-        template = random.choice(templates)
+        template = rng.choice(templates)
 
-        equipment = random.choice(EQUIPMENT_TYPES)
-        equip_num = random.randint(100, 999)
+        equipment = rng.choice(EQUIPMENT_TYPES)
+        equip_num = rng.randint(100, 999)
         equipment_id = f"{equipment['id_prefix']}-{equip_num}"
 
-        date = start_date + timedelta(days=random.randint(0, 365))
+        date = start_date + timedelta(days=rng.randint(0, 365))
 
-        variant_idx = random.randint(0, len(template["root_causes"]) - 1)
+        variant_idx = rng.randint(0, len(template["root_causes"]) - 1)
 
         min_hours, max_hours = template["repair_hours"]
-        repair_hours = round(random.uniform(min_hours, max_hours), 1)
+        repair_hours = round(rng.uniform(min_hours, max_hours), 1)
 
         log = {
-            "log_id": f"ML-2024-{str(i + 1).zfill(4)}",
+            "log_id": f"ML-2024-{str(first_log_num + i).zfill(id_width)}",
             "date": date.strftime("%Y-%m-%d"),
             "equipment_id": equipment_id,
             "equipment_type": equipment["type"],
@@ -286,8 +294,8 @@ def generate_logs(num_logs=75):
             "resolution": template["resolutions"][variant_idx],
             "parts_replaced": template["parts"][variant_idx],
             "repair_time_hours": repair_hours,
-            "engineer_notes": generate_engineer_note(equipment["type"], category),
-            "severity": random.choice(template["severity"]),
+            "engineer_notes": generate_engineer_note(equipment["type"], category, rng),
+            "severity": rng.choice(template["severity"]),
         }
 
         logs.append(log)
@@ -298,9 +306,55 @@ def generate_logs(num_logs=75):
     return logs
 
 
+def shard_seed(seed, shard_index):
+    """Deterministic per-shard seed, independent of worker count and scheduling."""
+    return f"{seed}:{shard_index}"
+
+
+def _generate_shard(args):
+    """Worker entry point: render one shard as JSONL text."""
+    shard_index, shard_size, num_logs, seed, id_width = args
+    first = shard_index * shard_size
+    count = min(shard_size, num_logs - first)
+    logs = generate_logs(count, shard_seed(seed, shard_index), first_log_num=first + 1, id_width=id_width)
+    return "".join(json.dumps(log, ensure_ascii=False) + "\n" for log in logs)
+
+
+def write_sharded_jsonl(output_path, num_logs, shard_size=10_000, workers=None, seed=SEED):
+    """Generate `num_logs` logs in independent shards across processes, streaming
+    them to `output_path` as JSONL in shard order.
+
+    Each shard has its own seed, so shard N is identical regardless of how many
+    workers produced it. Only a handful of shards are held in memory at a time.
+    """
+    num_shards = -(-num_logs // shard_size)
+    id_width = max(4, len(str(num_logs)))
+    tasks = ((i, shard_size, num_logs, seed, id_width) for i in range(num_shards))
+    with multiprocessing.Pool(workers) as pool, open(output_path, "w", encoding="utf-8") as f:
+        for done, shard in enumerate(pool.imap(_generate_shard, tasks), 1):
+            f.write(shard)
+            print(f"  shard {done}/{num_shards} written", end="\r")
+    print()
+
+
 if __name__ == "__main__":
-    logs = generate_logs(75)
-    output_path = "maintenance_logs.json"
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(logs, f, indent=2, ensure_ascii=False)
-    print(f"Generated {len(logs)} maintenance logs saved to {output_path}")
+    parser = argparse.ArgumentParser(description="Generate synthetic maintenance logs.")
+    parser.add_argument("--num-logs", type=int, default=75, help="Number of logs to generate (default: 75).")
+    parser.add_argument(
+        "--output",
+        default="maintenance_logs.json",
+        help="Output file; a .jsonl path switches to sharded, streamed generation (default: %(default)s).",
+    )
+    parser.add_argument("--shard-size", type=int, default=10_000, help="Logs per shard for JSONL output.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Generator processes for JSONL output.")
+    parser.add_argument("--seed", type=int, default=SEED, help="Base seed (default: %(default)s).")
+    args = parser.parse_args()
+
+    if args.output.endswith(".jsonl"):
+        write_sharded_jsonl(args.output, args.num_logs, args.shard_size, args.workers, args.seed)
+        print(f"Generated {args.num_logs} maintenance logs saved to {args.output}")
+    else:
+        logs = generate_logs(args.num_logs, args.seed)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(logs, f, indent=2, ensure_ascii=False)
+        print(f"Generated {len(logs)} maintenance logs saved to {args.output}")
@@ -0,0 +1,115 @@
+import argparse
+import os
+import sys
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# ---------------------------------------------------------------------------
+# Backend selection
+#
+#   torch      — fp32 PyTorch (reference)
+#   onnx       — fp32 ONNX Runtime export of the same weights
+#   onnx-int8  — dynamically int8-quantised ONNX export
+#
+# Pick one with the EMBEDDING_BACKEND environment variable. All three load
+# through SentenceTransformer and so share the same `encode` contract; the
+# ONNX backends need `pip install "sentence-transformers[onnx]"`. The
+# quantised file defaults to the AVX2 build, which runs on any modern x86 CPU;
+# set EMBEDDING_ONNX_INT8_FILE to e.g. "onnx/model_qint8_avx512_vnni.onnx" on
+# nodes that support it, or "onnx/model_qint8_arm64.onnx" on ARM.
+# ---------------------------------------------------------------------------
+BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+ONNX_INT8_FILE = os.environ.get("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+# Documented tolerance against the fp32 torch reference, checked by
+# `python embedder.py --check <backend>`:
+#   min_cosine    — lowest cosine similarity between a text's reference vector
+#                   and the backend's vector, over the sample chunks
+#   min_overlap   — lowest fraction of the reference top-k chunk ids the
+#                   backend also returns, over the sample queries
+TOLERANCE = {
+    "torch": {"min_cosine": 0.99999, "min_overlap": 1.0},
+    "onnx": {"min_cosine": 0.9999, "min_overlap": 0.9},
+    "onnx-int8": {"min_cosine": 0.98, "min_overlap": 0.8},
+}
+CHECK_TOP_K = 10
+CHECK_QUERIES = [
+    "Engine overheating under sustained load",
+    "Black smoke from exhaust and rough idle",
+    "Hydraulic pressure loss and fluid leak",
+    "Transmission slipping between gears",
+    "Battery drains overnight",
+    "Brake pedal feels spongy",
+    "Wastegate actuator replacement",
+    "Starter motor clicks but engine does not crank",
+]
+
+
+def embedding_key(backend: str = EMBEDDING_BACKEND) -> str:
+    """Identifier for the vectors a backend produces, e.g. for cache keys.
+    fp32 backends produce interchangeable vectors; int8 does not."""
+    return EMBEDDING_MODEL if backend in ("torch", "onnx") else f"{EMBEDDING_MODEL}:{backend}"
+
+
+def load_embedder(backend: str = EMBEDDING_BACKEND):
+    """Load the embedding model on the requested backend."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(EMBEDDING_MODEL)
+    if backend == "onnx":
+        return SentenceTransformer(EMBEDDING_MODEL, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(EMBEDDING_MODEL, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE})
+    raise ValueError(f"Unknown embedding backend '{backend}'. Choose one of: {', '.join(BACKENDS)}.")
+
+
+def check_backend(backend: str, texts: list[str], ids: list[str]) -> dict:
+    """Measure a backend against the fp32 torch reference on `texts`."""
+    import numpy as np
+
+    reference_model = load_embedder("torch")
+    candidate_model = load_embedder(backend)
+
+    reference = reference_model.encode(texts, normalize_embeddings=True)
+    candidate = candidate_model.encode(texts, normalize_embeddings=True)
+    cosines = np.sum(reference * candidate, axis=1)
+
+    ref_queries = reference_model.encode(CHECK_QUERIES, normalize_embeddings=True)
+    cand_queries = candidate_model.encode(CHECK_QUERIES, normalize_embeddings=True)
+    overlaps = []
+    for ref_q, cand_q in zip(ref_queries, cand_queries):
+        ref_top = {ids[i] for i in np.argsort(-(reference @ ref_q))[:CHECK_TOP_K]}
+        cand_top = {ids[i] for i in np.argsort(-(candidate @ cand_q))[:CHECK_TOP_K]}
+        overlaps.append(len(ref_top & cand_top) / CHECK_TOP_K)
+
+    return {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "min_overlap": min(overlaps),
+        "mean_overlap": sum(overlaps) / len(overlaps),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check an embedding backend against the fp32 reference.")
+    parser.add_argument("--check", choices=BACKENDS, required=True, help="Backend to validate.")
+    args = parser.parse_args()
+
+    from ingest import DATA_PATH, iter_chunks, iter_logs
+
+    chunks = list(iter_chunks(iter_logs(DATA_PATH)))
+    result = check_backend(args.check, [c["text"] for c in chunks], [c["id"] for c in chunks])
+    tolerance = TOLERANCE[args.check]
+
+    print(f"Backend '{args.check}' vs fp32 torch over {len(chunks)} chunks, {len(CHECK_QUERIES)} queries:")
+    print(f"  cosine similarity: min {result['min_cosine']:.5f}, mean {result['mean_cosine']:.5f} "
+          f"(tolerance ≥ {tolerance['min_cosine']})")
+    print(f"  top-{CHECK_TOP_K} overlap:     min {result['min_overlap']:.2f}, mean {result['mean_overlap']:.2f} "
+          f"(tolerance ≥ {tolerance['min_overlap']})")
+
+    if result["min_cosine"] < tolerance["min_cosine"] or result["min_overlap"] < tolerance["min_overlap"]:
+        print("FAIL: backend is outside the documented tolerance.")
+        sys.exit(1)
+    print("OK: backend is within the documented tolerance.")
@@ -0,0 +1,234 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), "cache", "embeddings.sqlite")
+MAX_ENTRIES = 500_000  # ~770 MB of float32 vectors at 384 dims
+_LOOKUP_CHUNK = 500  # stay well under SQLite's bound-parameter limit
+QUERY_SAVE_EVERY = 32  # query cache misses between rewrites of its file
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by (model name, text hash).
+
+    Vectors are stored as raw float32 blobs in SQLite. Every read refreshes an
+    entry's last-used time, and writes evict the least recently used entries
+    once the cache grows past `max_entries`.
+    """
+
+    def __init__(self, model_name: str, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "  key TEXT PRIMARY KEY,"
+            "  vector BLOB NOT NULL,"
+            "  last_used REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: list[str]) -> dict[str, np.ndarray]:
+        """Return {text: vector} for every text already cached."""
+        keys = {self.key(text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+        for i in range(0, len(key_list), _LOOKUP_CHUNK):
+            batch = key_list[i : i + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob in rows:
+                found[keys[key]] = np.frombuffer(blob, dtype=np.float32)
+
+        now = time.time()
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+            [(now, self.key(text)) for text in found],
+        )
+        self._conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, texts: list[str], vectors) -> None:
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [
+                (self.key(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for text, vector in zip(texts, vectors)
+            ],
+        )
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "  SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?"
+                ")",
+                (overflow,),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def encode_with_cache(texts: list[str], encode, cache: EmbeddingCache | None) -> np.ndarray:
+    """Embed `texts` in order, encoding each distinct uncached text only once.
+
+    `encode` takes a list of texts and returns one vector per text; it is not
+    called at all when every text is already cached.
+    """
+    unique = list(dict.fromkeys(texts))
+    vectors = cache.get_many(unique) if cache is not None else {}
+
+    missing = [text for text in unique if text not in vectors]
+    if missing:
+        encoded = np.asarray(encode(missing), dtype=np.float32)
+        vectors.update(zip(missing, encoded))
+        if cache is not None:
+            cache.put_many(missing, encoded)
+
+    return np.stack([vectors[text] for text in texts])
+
+
+class QueryEmbeddingCache:
+    """Bounded in-memory LRU of normalised query text → embedding.
+
+    Queries are normalised by lower-casing and collapsing whitespace, which
+    the uncased MiniLM tokenizer ignores anyway, so a hit returns exactly the
+    vector the model would. With a `path`, the cache is reloaded on start-up
+    and rewritten every `save_every` misses and at exit; entries from a
+    different `model_key` are discarded. Writes work from a snapshot taken
+    under the lock, so lookups never wait on the file.
+    """
+
+    def __init__(
+        self,
+        model_key: str,
+        max_entries: int = 256,
+        path: str | None = None,
+        save_every: int = QUERY_SAVE_EVERY,
+    ):
+        self.model_key = model_key
+        self.max_entries = max_entries
+        self.path = path
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, list[float]] = OrderedDict()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer at a time, outside `_lock`
+
+        if path:
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+                if saved.get("model") == model_key:
+                    self._entries.update(saved["entries"][-max_entries:])
+            atexit.register(self.save)
+
+    @staticmethod
+    def normalise(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def get_or_encode(self, query: str, encode) -> list[float]:
+        """Return the cached embedding for `query`, calling `encode(text)` on a miss."""
+        key = self.normalise(query)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        embedding = encode(key)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = embedding
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            save_due = self._mark_unsaved(1)
+        if save_due:
+            self.save()
+        return embedding
+
+    def get_or_encode_many(self, queries: list[str], encode_many) -> list[list[float]]:
+        """Batch form of `get_or_encode`: every distinct miss goes to a single
+        `encode_many(texts)` call, which returns one vector per text."""
+        keys = [self.normalise(query) for query in queries]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+            hits = sum(key in found for key in keys)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            found.update(zip(missing, encode_many(missing)))
+            with self._lock:
+                for key in missing:
+                    self._entries[key] = found[key]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                save_due = self._mark_unsaved(len(missing))
+            if save_due:
+                self.save()
+        return [found[key] for key in keys]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+    def _mark_unsaved(self, count: int) -> bool:
+        """Count new entries (call under `_lock`); True once a save is due."""
+        if not self.path:
+            return False
+        self._unsaved += count
+        return self._unsaved >= self.save_every
+
+    def save(self) -> None:
+        """Write the cache to `path` if it has entries not yet on disk."""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._unsaved:
+                    return
+                entries = list(self._entries.items())
+                self._unsaved = 0
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_key, "entries": entries}, f)
+            os.replace(tmp_path, self.path)
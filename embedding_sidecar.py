@@ -0,0 +1,79 @@
+import json
+import os
+
+import numpy as np
+
+SIDECAR_FILE = "embeddings.f32"  # float32 matrix written alongside ChromaDB in VECTORSTORE_PATH
+
+
+class EmbeddingSidecar:
+    """Append-only float32 embedding matrix on disk, with an id → row index.
+
+    Rows are written contiguously to `path` (raw little-endian float32, no
+    header) so the whole matrix can be memory-mapped with `load_sidecar()`.
+    The index lives next to it as `<path>.index.json` and maps each chunk id
+    to its row and the content hash it was embedded from. Re-embedding a
+    chunk appends a new row and repoints the index; the old row is only
+    reclaimed when the sidecar is rebuilt with `reset=True`.
+    """
+
+    def __init__(self, path: str, reset: bool = False):
+        self.path = path
+        self.index_path = path + ".index.json"
+        self.dim = None
+        self.rows = 0
+        self.ids: dict[str, list] = {}
+
+        if reset and os.path.exists(self.index_path):
+            os.remove(self.index_path)
+        elif os.path.exists(self.index_path) and os.path.exists(self.path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self.dim, self.rows, self.ids = index["dim"], index["rows"], index["ids"]
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if not self.ids:
+            self.rows = 0
+            self._file = open(self.path, "wb")
+        else:
+            self._file = open(self.path, "r+b")
+            # Drop any rows written after the last saved index (e.g. an interrupted run)
+            self._file.truncate(self.rows * self.dim * 4)
+            self._file.seek(0, os.SEEK_END)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.ids
+
+    def append(self, ids: list[str], hashes: list[str], embeddings: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match sidecar dimension {self.dim}.")
+
+        self._file.write(embeddings.tobytes())
+        for offset, (chunk_id, content_hash) in enumerate(zip(ids, hashes)):
+            self.ids[chunk_id] = [self.rows + offset, content_hash]
+        self.rows += len(ids)
+
+    def remove(self, ids: list[str]):
+        for chunk_id in ids:
+            self.ids.pop(chunk_id, None)
+
+    def close(self):
+        """Flush the matrix, then atomically replace the index."""
+        self._file.close()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "rows": self.rows, "ids": self.ids}, f)
+        os.replace(tmp_path, self.index_path)
+
+
+def load_sidecar(path: str) -> tuple[np.ndarray, dict[str, list]]:
+    """Memory-map a sidecar read-only. Returns (matrix, {chunk id: [row, content hash]})."""
+    with open(path + ".index.json", "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if not index["rows"]:
+        return np.empty((0, index["dim"] or 0), dtype=np.float32), index["ids"]
+    matrix = np.memmap(path, dtype="<f4", mode="r", shape=(index["rows"], index["dim"]))
+    return matrix, index["ids"]
@@ -1,6 +1,14 @@
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
 import json
+import multiprocessing
 import os
+import queue
 import sys
+import threading
+import time
 
 # Workaround for ChromaDB + Pydantic v1 on Python 3.14+
 # Pydantic v1 cannot infer types from annotations on Python 3.14 due to PEP 649
@@ -22,12 +30,23 @@ if sys.version_info >= (3, 14):
     _pv1_fields.ModelField._set_default_and_type = _patched_set_default_and_type
 
 import chromadb
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from embedder import EMBEDDING_BACKEND, EMBEDDING_MODEL, embedding_key, load_embedder
+from embedding_cache import EmbeddingCache, encode_with_cache
+from embedding_sidecar import SIDECAR_FILE, EmbeddingSidecar, load_sidecar
+from lexical_index import LEXICAL_INDEX_FILE, BM25IndexBuilder
+from vector_store import CHUNK_STORE_FILE, bump_collection_version
+
 DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "maintenance_logs.json")
 VECTORSTORE_PATH = os.path.join(os.path.dirname(__file__), "vectorstore")
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 COLLECTION_NAME = "maintenance_logs"
+WINDOW_SIZE = 1000  # chunks held in memory per chunk → embed → write window
+ENCODE_BATCH_SIZE = 32  # chunks per model.encode call
+WRITE_BATCH_SIZE = 100  # chunks per ChromaDB upsert
+QUEUE_SIZE = 8  # encoded batches buffered between the embedder and the writer
+MAX_LOG_IDS = 20  # ids kept in a deduplicated chunk's log_ids / equipment_ids metadata
 
 
 def load_logs(path: str) -> list[dict]:
@@ -35,12 +54,68 @@ def load_logs(path: str) -> list[dict]:
         return json.load(f)
 
 
+def _iter_json_array(f, read_size: int = 1 << 16):
+    """Yield the elements of a JSON array one at a time from a file positioned
+    just after its opening bracket, reading at most `read_size` chars per step."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        # Skip whitespace and separators, pulling in more input as needed
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            more = f.read(read_size)
+            eof = not more
+            buffer, pos = buffer[pos:] + more, 0
+
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array in log export.")
+        if buffer[pos] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Element is split across reads — extend the buffer and retry
+            if eof:
+                raise
+            more = f.read(read_size)
+            eof = not more
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+
+        yield item
+        pos = end
+
+
+def iter_logs(path: str):
+    """Stream logs from a JSON array or JSONL export without loading the whole file."""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+
+        if head == "[":
+            yield from _iter_json_array(f)
+        elif head:
+            first_line = head + f.readline()
+            for line in itertools.chain([first_line], f):
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
 def chunk_log(log: dict) -> list[dict]:
     """Split a single maintenance log into meaningful semantic chunks."""
     log_id = log["log_id"]
     base_meta = {
         "log_id": log_id,
         "date": log["date"],
+        "date_int": int(log["date"].replace("-", "")),  # numeric copy for range filters
         "equipment_id": log["equipment_id"],
         "equipment_type": log["equipment_type"],
         "severity": log["severity"],
@@ -102,54 +177,539 @@ def chunk_log(log: dict) -> list[dict]:
     return chunks
 
 
-def ingest():
-    print(f"Loading maintenance logs from {DATA_PATH}...")
-    logs = load_logs(DATA_PATH)
-    print(f"Loaded {len(logs)} logs.")
+def chunk_hash(chunk: dict) -> str:
+    """Stable content hash over a chunk's text and metadata."""
+    payload = json.dumps(
+        {"text": chunk["text"], "metadata": chunk["metadata"]},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-    # Chunk all logs
-    all_chunks = []
+
+def iter_chunks(logs):
+    """Chunk logs lazily, tagging each chunk with a hash of its content."""
     for log in logs:
-        all_chunks.extend(chunk_log(log))
-    print(f"Created {len(all_chunks)} chunks ({len(all_chunks) // len(logs)} per log).")
+        for chunk in chunk_log(log):
+            chunk["metadata"]["content_hash"] = chunk_hash(chunk)
+            yield chunk
+
+
+SEVERITY_ORDER = ("low", "medium", "high", "critical")
+
+
+def dedupe_chunks(chunks):
+    """Collapse chunks with identical text into one canonical chunk each.
+
+    Every distinct text is stored once, under an id derived from its hash.
+    Its metadata is that of the most recent occurrence, plus:
+      log_ids / equipment_ids — comma-separated, the last MAX_LOG_IDS
+                                logs/equipment it covers
+      occurrences             — number of logs that produced this text
+    `severity` is the highest seen across occurrences, so a severity filter
+    matches a text by its worst occurrence only: one logged as both medium
+    and high matches "high" but not "medium".
+
+    Needs the whole stream before yielding, so memory grows with the number
+    of distinct texts rather than the window size.
+    """
+    groups: dict[str, dict] = {}
+    total = 0
+    for chunk in chunks:
+        total += 1
+        meta = chunk["metadata"]
+        group = groups.get(chunk["text"])
+        if group is None:
+            groups[chunk["text"]] = {"latest": meta, "log_ids": [meta["log_id"]],
+                                     "equipment_ids": [meta["equipment_id"]], "severity": meta["severity"]}
+            continue
+        group["log_ids"].append(meta["log_id"])
+        group["equipment_ids"].append(meta["equipment_id"])
+        if meta["date"] >= group["latest"]["date"]:
+            group["latest"] = meta
+        if SEVERITY_ORDER.index(meta["severity"]) > SEVERITY_ORDER.index(group["severity"]):
+            group["severity"] = meta["severity"]
+
+    print(f"Deduplicated {total} chunks to {len(groups)} distinct texts.")
+    for text, group in groups.items():
+        meta = {key: value for key, value in group["latest"].items() if key != "content_hash"}
+        meta.update({
+            "severity": group["severity"],
+            "log_ids": ",".join(group["log_ids"][-MAX_LOG_IDS:]),
+            "equipment_ids": ",".join(list(dict.fromkeys(group["equipment_ids"]))[-MAX_LOG_IDS:]),
+            "occurrences": len(group["log_ids"]),
+        })
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        chunk = {"id": f"{meta['chunk_type']}_{text_hash}", "text": text, "metadata": meta}
+        chunk["metadata"]["content_hash"] = chunk_hash(chunk)
+        yield chunk
+
+
+def batched(iterable, size: int):
+    """Yield successive lists of up to `size` items from any iterable."""
+    it = iter(iterable)
+    while batch := list(itertools.islice(it, size)):
+        yield batch
+
+
+def get_stored_hashes(collection, page_size: int = 1000) -> dict[str, str]:
+    """Return {chunk id: content hash} for everything already in the collection."""
+    stored = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        for chunk_id, meta in zip(page["ids"], page["metadatas"]):
+            stored[chunk_id] = (meta or {}).get("content_hash", "")
+        if len(page["ids"]) < page_size:
+            return stored
+        offset += page_size
+
+
+def diff_chunks(chunks: list[dict], stored: dict[str, str]) -> tuple[list[dict], list[dict]]:
+    """Split chunks into those added and those changed relative to the stored hashes."""
+    added, changed = [], []
+    for chunk in chunks:
+        previous = stored.get(chunk["id"])
+        if previous is None:
+            added.append(chunk)
+        elif previous != chunk["metadata"]["content_hash"]:
+            changed.append(chunk)
+    return added, changed
+
+
+def write_chunks(collection, chunks: list[dict], embeddings, batch_size: int = WRITE_BATCH_SIZE):
+    """Upsert chunks with their embeddings, respecting ChromaDB's batch size limits."""
+    for i in range(0, len(chunks), batch_size):
+        batch = chunks[i : i + batch_size]
+        collection.upsert(
+            ids=[chunk["id"] for chunk in batch],
+            documents=[chunk["text"] for chunk in batch],
+            embeddings=embeddings[i : i + batch_size],
+            metadatas=[chunk["metadata"] for chunk in batch],
+        )
+
+
+# ---------------------------------------------------------------------------
+# Multi-process encoding
+# ---------------------------------------------------------------------------
+_worker_model: SentenceTransformer | None = None
+
+
+def _init_encode_worker(backend: str):
+    """Load one model per worker process, pinned to a single core."""
+    global _worker_model
+    import torch
+
+    torch.set_num_threads(1)
+    _worker_model = load_embedder(backend)
+
+
+def _encode_in_worker(texts: list[str], batch_size: int):
+    return _worker_model.encode(texts, batch_size=batch_size)
+
+
+def start_encode_pool(workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    """Start a pool of encoding processes, each holding its own model copy.
+
+    Uses the spawn start method: forking after ChromaDB and the writer thread
+    are running is not safe.
+    """
+    print(f"Starting {workers} encoding workers ({EMBEDDING_MODEL}, {EMBEDDING_BACKEND} backend)...")
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_encode_worker,
+        initargs=(EMBEDDING_BACKEND,),
+    )
+
+
+def parallel_encode(pool, texts: list[str], batch_size: int) -> np.ndarray:
+    """Shard texts into `batch_size` slices across the pool and reassemble them in order.
+
+    Each shard is a separate encode call of at most one model batch, exactly
+    as the single-process path encodes it, so both paths produce the same vectors.
+    """
+    shards = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+    return np.concatenate(list(pool.map(_encode_in_worker, shards, [batch_size] * len(shards))))
+
+
+def _write_worker(
+    collection,
+    sidecar: EmbeddingSidecar,
+    batches: queue.Queue,
+    write_batch_size: int,
+    stage: dict,
+):
+    """Consumer side of the ingest pipeline: drain encoded batches into ChromaDB
+    and the embedding sidecar.
+
+    Encoded batches are regrouped into `write_batch_size` upserts. A `None`
+    item marks the end of the stream. After a failed write the worker keeps
+    draining (without writing) so the producer never blocks on a full queue.
+    """
+    pending_chunks = []
+    pending_embeddings = None
+
+    def flush(count: int):
+        nonlocal pending_embeddings
+        start = time.perf_counter()
+        chunks, embeddings = pending_chunks[:count], pending_embeddings[:count]
+        write_chunks(collection, chunks, embeddings, write_batch_size)
+        sidecar.append(
+            [chunk["id"] for chunk in chunks],
+            [chunk["metadata"]["content_hash"] for chunk in chunks],
+            embeddings,
+        )
+        stage["seconds"] += time.perf_counter() - start
+        stage["chunks"] += count
+        del pending_chunks[:count]
+        pending_embeddings = pending_embeddings[count:]
+
+    while (item := batches.get()) is not None:
+        if stage["error"] is not None:
+            continue
+        chunks, embeddings = item
+        pending_chunks.extend(chunks)
+        if pending_embeddings is None or not len(pending_embeddings):
+            pending_embeddings = embeddings
+        else:
+            pending_embeddings = np.concatenate((pending_embeddings, embeddings))
+        try:
+            while len(pending_chunks) >= write_batch_size:
+                flush(write_batch_size)
+        except Exception as exc:
+            stage["error"] = exc
+
+    if stage["error"] is None and pending_chunks:
+        try:
+            flush(len(pending_chunks))
+        except Exception as exc:
+            stage["error"] = exc
+
+
+def report_throughput(stages: dict, wall_seconds: float):
+    """Print per-stage throughput and which stage bounded the run."""
+    print(f"Pipeline throughput ({wall_seconds:.2f}s wall):")
+    for name, stage in stages.items():
+        rate = stage["chunks"] / stage["seconds"] if stage["seconds"] else 0.0
+        print(f"  {name:<7} {stage['chunks']:>8} chunks in {stage['seconds']:7.2f}s busy ({rate:,.1f} chunks/sec)")
+    if any(stage["chunks"] for stage in stages.values()):
+        bottleneck = max(stages, key=lambda name: stages[name]["seconds"])
+        print(f"  Bottleneck: {bottleneck}")
 
-    # Load embedding model
-    print(f"Loading embedding model: {EMBEDDING_MODEL}...")
-    model = SentenceTransformer(EMBEDDING_MODEL)
 
-    # Generate embeddings
-    texts = [chunk["text"] for chunk in all_chunks]
-    print("Generating embeddings...")
-    embeddings = model.encode(texts, show_progress_bar=True, batch_size=32)
+def ingest(
+    data_path: str = DATA_PATH,
+    incremental: bool = False,
+    window_size: int = WINDOW_SIZE,
+    encode_batch_size: int = ENCODE_BATCH_SIZE,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    use_cache: bool = True,
+    workers: int = 1,
+    dedupe: bool = False,
+):
+    """Stream logs through chunk → embed → write in fixed-size windows so peak
+    memory is bounded by `window_size` rather than by the size of the export.
 
-    # Store in ChromaDB
-    print(f"Storing in ChromaDB at {VECTORSTORE_PATH}...")
+    Encoding and writing run as a producer/consumer pipeline: this thread
+    encodes batches into a bounded queue while a writer thread drains it into
+    ChromaDB, so the model and the store work at the same time.
+
+    With `use_cache`, texts are deduplicated per batch and looked up in the
+    on-disk embedding cache first; only cache misses reach the model.
+
+    With `workers` > 1, encoding is sharded across a process pool in
+    `encode_batch_size` slices, `workers` slices at a time.
+
+    With `dedupe`, identical chunk texts are stored once (see `dedupe_chunks`).
+
+    The BM25 lexical index always covers every chunk. Its postings are spilled
+    to temporary run files once per window and merged when the index is
+    saved, so it holds one window of postings plus one id and token length
+    per chunk, like `seen_ids`.
+
+    Returns the run's log and chunk counts, per-stage busy time and wall time.
+    """
+    wall_start = time.perf_counter()
+    print(f"Opening ChromaDB at {VECTORSTORE_PATH}...")
     client = chromadb.PersistentClient(path=VECTORSTORE_PATH)
 
-    # Delete existing collection if it exists to allow re-ingestion
+    if incremental:
+        collection = client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            metadata={"description": "Heavy vehicle fleet maintenance logs"},
+        )
+        stored = get_stored_hashes(collection)
+    else:
+        # Delete existing collection if it exists to allow re-ingestion
+        try:
+            client.delete_collection(COLLECTION_NAME)
+        except Exception:
+            pass
+
+        collection = client.create_collection(
+            name=COLLECTION_NAME,
+            metadata={"description": "Heavy vehicle fleet maintenance logs"},
+        )
+        stored = {}
+
+    stats = {"logs": 0, "chunks": 0, "added": 0, "changed": 0}
+
+    def counted_logs():
+        for log in iter_logs(data_path):
+            stats["logs"] += 1
+            yield log
+
+    # A full rebuild also rewrites (and so compacts) the sidecar
+    sidecar = EmbeddingSidecar(os.path.join(VECTORSTORE_PATH, SIDECAR_FILE), reset=not incremental)
+
+    stages = {
+        "encode": {"chunks": 0, "seconds": 0.0},
+        "write": {"chunks": 0, "seconds": 0.0, "error": None},
+    }
+    encoded_batches = queue.Queue(maxsize=QUEUE_SIZE)
+    writer = threading.Thread(
+        target=_write_worker,
+        args=(collection, sidecar, encoded_batches, write_batch_size, stages["write"]),
+        daemon=True,
+    )
+    writer.start()
+
+    print(f"Streaming maintenance logs from {data_path} in windows of {window_size} chunks...")
+    model = None
+    pool = None
+    cache = EmbeddingCache(embedding_key()) if use_cache else None
+
+    def encode(texts: list[str]):
+        # Load embedding model (or start the pool) only once there is something to encode
+        nonlocal model, pool
+        if workers > 1:
+            if pool is None:
+                pool = start_encode_pool(workers)
+            return parallel_encode(pool, texts, encode_batch_size)
+        if model is None:
+            print(f"Loading embedding model: {EMBEDDING_MODEL} ({EMBEDDING_BACKEND} backend)...")
+            model = load_embedder()
+        return np.concatenate([
+            model.encode(texts[i : i + encode_batch_size], batch_size=encode_batch_size)
+            for i in range(0, len(texts), encode_batch_size)
+        ])
+
+    chunks = iter_chunks(counted_logs())
+    if dedupe:
+        chunks = dedupe_chunks(chunks)
+
+    # The lexical index is cheap to rebuild, so it always covers every chunk
+    lexical = BM25IndexBuilder()
+    # ...and so does the chunk store the in-process NumPy backend loads
+    chunk_store_path = os.path.join(VECTORSTORE_PATH, CHUNK_STORE_FILE)
+    chunk_store = open(chunk_store_path + ".tmp", "w", encoding="utf-8")
+    seen_ids = set()
     try:
-        client.delete_collection(COLLECTION_NAME)
+        for window in batched(chunks, window_size):
+            stats["chunks"] += len(window)
+            seen_ids.update(chunk["id"] for chunk in window)
+            for chunk in window:
+                lexical.add(chunk["id"], chunk["text"])
+                chunk_store.write(json.dumps(
+                    {"id": chunk["id"], "text": chunk["text"], "metadata": chunk["metadata"]}
+                ) + "\n")
+            lexical.flush()
+
+            added, changed = diff_chunks(window, stored)
+            stats["added"] += len(added)
+            stats["changed"] += len(changed)
+            to_embed = added + changed
+            if not to_embed:
+                continue
+
+            for batch in batched(to_embed, encode_batch_size * max(workers, 1)):
+                if stages["write"]["error"] is not None:
+                    break
+                start = time.perf_counter()
+                embeddings = encode_with_cache([chunk["text"] for chunk in batch], encode, cache)
+                stages["encode"]["seconds"] += time.perf_counter() - start
+                stages["encode"]["chunks"] += len(batch)
+                encoded_batches.put((batch, embeddings))
+            print(f"  {stats['chunks']} chunks processed ({stats['added'] + stats['changed']} embedded)")
+    finally:
+        chunk_store.close()
+        encoded_batches.put(None)
+        writer.join()
+        if cache is not None:
+            cache.close()
+        if pool is not None:
+            pool.shutdown()
+
+    if stages["write"]["error"] is not None:
+        raise stages["write"]["error"]
+
+    print(f"Read {stats['logs']} logs into {stats['chunks']} chunks.")
+
+    removed = [chunk_id for chunk_id in stored if chunk_id not in seen_ids]
+    for i in range(0, len(removed), write_batch_size):
+        collection.delete(ids=removed[i : i + write_batch_size])
+    sidecar.remove(removed)
+
+    # Backfill sidecar rows for unchanged chunks embedded before the sidecar existed
+    missing = [chunk_id for chunk_id in seen_ids if chunk_id not in sidecar]
+    for i in range(0, len(missing), write_batch_size):
+        page = collection.get(ids=missing[i : i + write_batch_size], include=["embeddings", "metadatas"])
+        sidecar.append(
+            page["ids"],
+            [meta["content_hash"] for meta in page["metadatas"]],
+            np.asarray(page["embeddings"], dtype=np.float32),
+        )
+    sidecar.close()
+    lexical.save(os.path.join(VECTORSTORE_PATH, LEXICAL_INDEX_FILE))
+    os.replace(chunk_store_path + ".tmp", chunk_store_path)
+
+    # Lets query-side caches (e.g. the semantic answer cache) notice new data
+    if not incremental or stats["added"] + stats["changed"] + len(removed) > 0:
+        bump_collection_version(VECTORSTORE_PATH)
+
+    if incremental:
+        print(f"Delta: {stats['added']} added, {stats['changed']} changed, {len(removed)} removed.")
+    if stats["added"] + stats["changed"] == 0:
+        print("Nothing to embed — collection is up to date.")
+    elif cache is not None:
+        print(f"Embedding cache: {cache.hits} hits, {cache.misses} misses.")
+
+    wall_seconds = time.perf_counter() - wall_start
+    report_throughput(stages, wall_seconds)
+    print(f"Ingestion complete. {collection.count()} vectors stored in '{COLLECTION_NAME}' collection.")
+    return {
+        **stats,
+        "removed": len(removed),
+        "stages": {name: {"chunks": stage["chunks"], "seconds": stage["seconds"]} for name, stage in stages.items()},
+        "wall_seconds": wall_seconds,
+    }
+
+
+def rebuild_from_sidecar(
+    data_path: str = DATA_PATH,
+    collection_name: str = COLLECTION_NAME,
+    write_batch_size: int = WRITE_BATCH_SIZE,
+    dedupe: bool = False,
+):
+    """Recreate a collection from the embedding sidecar without running the model.
+
+    Chunks are re-derived from the log export (cheap) and each is matched to
+    its sidecar row by id and content hash; pass the same `dedupe` setting
+    the sidecar was ingested with. Runs of consecutive rows are passed
+    to ChromaDB as zero-copy slices of the memory-mapped matrix.
+    """
+    sidecar_path = os.path.join(VECTORSTORE_PATH, SIDECAR_FILE)
+    print(f"Loading embedding sidecar from {sidecar_path}...")
+    matrix, index = load_sidecar(sidecar_path)
+
+    def chunks():
+        source = iter_chunks(iter_logs(data_path))
+        return dedupe_chunks(source) if dedupe else source
+
+    # Check every chunk has a current vector before touching the target collection
+    for chunk in chunks():
+        entry = index.get(chunk["id"])
+        if entry is None or entry[1] != chunk["metadata"]["content_hash"]:
+            raise ValueError(
+                f"Sidecar has no up-to-date vector for chunk '{chunk['id']}'. "
+                "Run ingest.py to embed it first."
+            )
+
+    client = chromadb.PersistentClient(path=VECTORSTORE_PATH)
+    try:
+        client.delete_collection(collection_name)
     except Exception:
         pass
-
     collection = client.create_collection(
-        name=COLLECTION_NAME,
+        name=collection_name,
         metadata={"description": "Heavy vehicle fleet maintenance logs"},
     )
 
-    # ChromaDB has batch size limits, so insert in batches
-    batch_size = 100
-    for i in range(0, len(all_chunks), batch_size):
-        batch = all_chunks[i : i + batch_size]
-        collection.add(
-            ids=[chunk["id"] for chunk in batch],
-            documents=[chunk["text"] for chunk in batch],
-            embeddings=[embeddings[i + j].tolist() for j in range(len(batch))],
-            metadatas=[chunk["metadata"] for chunk in batch],
-        )
+    for window in batched(chunks(), write_batch_size):
+        rows = [index[chunk["id"]][0] for chunk in window]
+        if rows[-1] - rows[0] == len(rows) - 1 and rows == sorted(rows):
+            embeddings = matrix[rows[0] : rows[-1] + 1]
+        else:
+            embeddings = matrix[rows]
+        write_chunks(collection, window, embeddings, write_batch_size)
 
-    print(f"Ingestion complete. {collection.count()} vectors stored in '{COLLECTION_NAME}' collection.")
+    bump_collection_version(VECTORSTORE_PATH)
+    print(f"Rebuild complete. {collection.count()} vectors stored in '{collection_name}' collection.")
 
 
 if __name__ == "__main__":
-    ingest()
+    parser = argparse.ArgumentParser(description="Ingest maintenance logs into ChromaDB.")
+    parser.add_argument(
+        "--data",
+        default=DATA_PATH,
+        help="Log export to ingest: a JSON array or JSONL file (default: bundled sample logs).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only embed added/changed chunks and delete removed ones instead of rebuilding.",
+    )
+    parser.add_argument(
+        "--window-size",
+        type=int,
+        default=WINDOW_SIZE,
+        help=f"Chunks per chunk → embed → write window (default: {WINDOW_SIZE}).",
+    )
+    parser.add_argument(
+        "--encode-batch-size",
+        type=int,
+        default=ENCODE_BATCH_SIZE,
+        help=f"Chunks per embedding batch, per worker with --workers (default: {ENCODE_BATCH_SIZE}).",
+    )
+    parser.add_argument(
+        "--write-batch-size",
+        type=int,
+        default=WRITE_BATCH_SIZE,
+        help=f"Chunks per ChromaDB upsert (default: {WRITE_BATCH_SIZE}).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk embedding cache and encode every chunk.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Encoding processes; above 1, batches are sharded across a process pool (default: 1).",
+    )
+    parser.add_argument(
+        "--from-sidecar",
+        action="store_true",
+        help="Rebuild the collection from the saved embedding sidecar instead of running the model.",
+    )
+    parser.add_argument(
+        "--collection",
+        default=COLLECTION_NAME,
+        help="Target collection for --from-sidecar, e.g. to migrate vectors (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Store each distinct chunk text once, with the log ids it covers in its metadata.",
+    )
+    args = parser.parse_args()
+    if args.from_sidecar:
+        rebuild_from_sidecar(
+            data_path=args.data,
+            collection_name=args.collection,
+            write_batch_size=args.write_batch_size,
+            dedupe=args.dedupe,
+        )
+        sys.exit(0)
+    ingest(
+        data_path=args.data,
+        incremental=args.incremental,
+        window_size=args.window_size,
+        encode_batch_size=args.encode_batch_size,
+        write_batch_size=args.write_batch_size,
+        use_cache=not args.no_cache,
+        workers=args.workers,
+        dedupe=args.dedupe,
+    )
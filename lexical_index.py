@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import json
+import math
+import os
+import re
+import tempfile
+from collections import Counter
+
+LEXICAL_INDEX_FILE = "lexical_index.json"  # written by ingest into VECTORSTORE_PATH
+
+# Keeps hyphenated identifiers such as "trk-446" or "ml-2024-0017" as single tokens
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it of on or that the this to was were with "
+    "what which how my our i".split()
+)
+K1 = 1.2
+B = 0.75
+MERGE_FAN_IN = 64  # spilled runs merged at once; more are merged in passes
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25IndexBuilder:
+    """Accumulates chunk texts into an inverted index and writes it to disk.
+
+    The on-disk format is a single JSON document: the chunk ids, their token
+    lengths, and per-term postings as two parallel int lists (document
+    indices, term frequencies).
+
+    Postings are held in memory only until `flush`, which spills them to a
+    term-sorted run file; `save` merges the runs into the index one term at a
+    time. Memory is then bounded by the chunks added between flushes plus one
+    id and length per chunk.
+    """
+
+    def __init__(self):
+        self.ids: list[str] = []
+        self.lengths: list[int] = []
+        self.postings: dict[str, tuple[list[int], list[int]]] = {}
+        self._spill_dir: tempfile.TemporaryDirectory | None = None
+        self._runs: list[str] = []
+        self._run_count = 0
+
+    def add(self, chunk_id: str, text: str):
+        doc = len(self.ids)
+        tokens = tokenize(text)
+        self.ids.append(chunk_id)
+        self.lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            docs, tfs = self.postings.setdefault(term, ([], []))
+            docs.append(doc)
+            tfs.append(tf)
+
+    def flush(self):
+        """Spill the postings added since the last flush to a sorted run file."""
+        if not self.postings:
+            return
+        entries = ((term, *self.postings[term]) for term in sorted(self.postings))
+        self._runs.append(self._write_run(entries))
+        self.postings = {}
+
+    def _write_run(self, entries) -> str:
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.TemporaryDirectory(prefix="bm25-runs-")
+        path = os.path.join(self._spill_dir.name, f"run-{self._run_count}.jsonl")
+        self._run_count += 1
+        with open(path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        return path
+
+    @staticmethod
+    def _merge_runs(paths: list[str]):
+        """Yield (term, docs, tfs) across run files in term order. Runs are
+        flushed in document order, so concatenating keeps each term's postings
+        sorted by document."""
+        files = [open(path, "r", encoding="utf-8") for path in paths]
+        try:
+            entries = heapq.merge(*(map(json.loads, f) for f in files), key=lambda entry: entry[0])
+            for term, group in itertools.groupby(entries, key=lambda entry: entry[0]):
+                docs, tfs = [], []
+                for _, run_docs, run_tfs in group:
+                    docs.extend(run_docs)
+                    tfs.extend(run_tfs)
+                yield term, docs, tfs
+        finally:
+            for f in files:
+                f.close()
+
+    def save(self, path: str):
+        self.flush()
+        runs = self._runs
+        while len(runs) > MERGE_FAN_IN:
+            runs = [
+                self._write_run(self._merge_runs(runs[i : i + MERGE_FAN_IN]))
+                for i in range(0, len(runs), MERGE_FAN_IN)
+            ]
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write('{"ids":' + json.dumps(self.ids, separators=(",", ":")))
+            f.write(',"lengths":' + json.dumps(self.lengths, separators=(",", ":")))
+            f.write(',"postings":{')
+            for i, (term, docs, tfs) in enumerate(self._merge_runs(runs)):
+                f.write(("," if i else "") + json.dumps(term) + ":" + json.dumps([docs, tfs], separators=(",", ":")))
+            f.write("}}")
+        os.replace(tmp_path, path)
+
+        if self._spill_dir is not None:
+            self._spill_dir.cleanup()
+            self._spill_dir = None
+        self._runs = []
+
+
+class BM25Index:
+    """Read-only BM25 index over chunk texts, loaded from a builder's output."""
+
+    def __init__(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.ids: list[str] = data["ids"]
+        n_docs = len(self.ids)
+        avg_length = sum(data["lengths"]) / n_docs if n_docs else 0.0
+
+        # Fold the document-length normalisation into one factor per document
+        self._norms = [K1 * (1 - B + B * length / avg_length) if avg_length else K1 for length in data["lengths"]]
+        self._postings = {}
+        for term, (docs, tfs) in data["postings"].items():
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            self._postings[term] = (idf, docs, tfs)
+
+    def search(self, query: str, k: int) -> list[tuple[str, float]]:
+        """Return up to `k` (chunk id, BM25 score) pairs, best first."""
+        scores: dict[int, float] = {}
+        norms = self._norms
+        for term in set(tokenize(query)):
+            entry = self._postings.get(term)
+            if entry is None:
+                continue
+            idf, docs, tfs = entry
+            for doc, tf in zip(docs, tfs):
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norms[doc])
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.ids[doc], score) for doc, score in best]
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+LLM_CACHE_PATH = os.path.join(os.path.dirname(__file__), "cache", "llm_responses.sqlite")
+MAX_ENTRIES = 10_000
+
+
+def request_key(**request) -> str:
+    """Stable hash of a Messages API request (model, max_tokens, system, messages, ...)."""
+    return hashlib.sha256(
+        json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+
+
+class LLMCache:
+    """On-disk exact-match cache of Claude response texts, keyed by `request_key`.
+
+    Same layout as the embedding cache: SQLite, last-used time refreshed on
+    every hit, least recently used entries evicted past `max_entries`. Safe
+    to share between threads. The first response to a request is replayed
+    for every identical request, even at a non-zero temperature.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "  key TEXT PRIMARY KEY,"
+            "  text TEXT NOT NULL,"
+            "  last_used REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, text: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, text, last_used) VALUES (?, ?, ?)",
+                (key, text, time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "  SELECT key FROM responses ORDER BY last_used ASC LIMIT ?"
+                    ")",
+                    (overflow,),
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class TokenUsage:
+    """Running totals of Messages API token usage, safe to share between threads.
+
+    `input_tokens` counts only uncached prompt tokens; prompt-cache reads and
+    writes are reported separately by the API and kept separately here.
+    """
+
+    FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+    def __init__(self):
+        self.calls = 0
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+        self._lock = threading.Lock()
+
+    def record(self, usage) -> None:
+        """Add a response's `usage` object."""
+        with self._lock:
+            self.calls += 1
+            for field in self.FIELDS:
+                self.totals[field] += getattr(usage, field, None) or 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            prompt_tokens = (
+                self.totals["input_tokens"]
+                + self.totals["cache_read_input_tokens"]
+                + self.totals["cache_creation_input_tokens"]
+            )
+            return {
+                "calls": self.calls,
+                **self.totals,
+                "cache_read_rate": self.totals["cache_read_input_tokens"] / prompt_tokens if prompt_tokens else 0.0,
+            }
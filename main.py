@@ -1,130 +1,685 @@
+from __future__ import annotations
+
+import time
+
+_IMPORT_START = time.perf_counter()
+
 import sys
 import os
+import itertools
+import json
+import argparse
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterator
 
-# ---------------------------------------------------------------------------
-# ChromaDB + Pydantic v1 monkey-patch for Python 3.14+
-# ---------------------------------------------------------------------------
-if sys.version_info >= (3, 14):
-    import pydantic.v1.fields as _pv1_fields
-    import pydantic.v1.errors as _pv1_errors
-    _orig_set_default_and_type = _pv1_fields.ModelField._set_default_and_type
+from typing_extensions import TypedDict, Annotated
 
-    def _patched_set_default_and_type(self):
-        try:
-            _orig_set_default_and_type(self)
-        except _pv1_errors.ConfigError:
-            if self.default is not None:
-                self.type_ = type(self.default)
-            else:
-                self.type_ = type(None)
-            self.outer_type_ = self.type_
+import numpy as np
 
-    _pv1_fields.ModelField._set_default_and_type = _patched_set_default_and_type
+from answer_cache import ANSWER_CACHE_PATH, SemanticAnswerCache
+from context_builder import build_context
+from embedder import embedding_key, load_embedder
+from embedding_cache import QueryEmbeddingCache
+from embedding_sidecar import SIDECAR_FILE
+from lexical_index import LEXICAL_INDEX_FILE, BM25Index
+from llm_cache import LLM_CACHE_PATH, LLMCache, TokenUsage, request_key
+from query_filters import extract_filters, join_conditions, split_conditions
+from rerank import mmr_select
+from vector_store import CHUNK_STORE_FILE, NumpyVectorStore, VectorStore, read_collection_version
 
-import chromadb
-import anthropic
-from sentence_transformers import SentenceTransformer
-from langgraph.graph import StateGraph, START, END
-from typing_extensions import TypedDict, Annotated
-import operator
-import json
+# chromadb, anthropic, sentence_transformers and langgraph each take a second
+# or more to import, so they are imported where first used
+if TYPE_CHECKING:
+    import anthropic
+    from langchain_core.runnables import RunnableConfig
+    from sentence_transformers import SentenceTransformer
 
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
 VECTORSTORE_PATH = os.path.join(os.path.dirname(__file__), "vectorstore")
 COLLECTION_NAME = "maintenance_logs"
-EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 CLAUDE_MODEL = "claude-sonnet-4-5-20250929"
 TOP_K = 10
+QUERY_CACHE_SIZE = 256
+# Set to a file path (e.g. cache/query_embeddings.json) to keep cached query
+# embeddings across restarts
+QUERY_CACHE_PATH = os.environ.get("QUERY_CACHE_PATH") or None
+HYBRID_SEARCH = True  # fuse BM25 and vector rankings when the lexical index exists
+HYBRID_CANDIDATES = 3 * TOP_K  # candidates taken from each ranking before fusion
+RRF_K = 60  # reciprocal rank fusion constant
+# Diversity reranking: over-fetch RERANK_CANDIDATES, then keep TOP_K chosen by
+# maximal marginal relevance so one log's four chunks don't crowd out the rest
+RERANK_CANDIDATES = 3 * TOP_K
+MMR_LAMBDA = 0.7  # relevance vs. novelty; 1.0 keeps plain relevance order
+MAX_CHUNKS_PER_LOG = 2  # None for no cap
+NEAR_DUPLICATE_SIMILARITY = 0.95  # cosine above which a candidate repeats an earlier pick
+# Estimated input tokens for the retrieved chunks in the analysis prompt; the
+# lowest-ranked chunks are dropped past it. None for no limit
+CONTEXT_TOKEN_BUDGET = 2000
+# "chroma", or "numpy" for exact in-process search over the ingest sidecar —
+# no ChromaDB client at query time, and usually faster below ~1M chunks
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+LLM_CONCURRENCY = 4  # concurrent Claude calls in run_queries
+ASYNC_CONCURRENCY = 16  # questions in flight at once in arun_queries
+# Semantic answer cache: reuse the final answer of an earlier question with the
+# same filters within this cosine similarity. Re-ingesting invalidates it.
+ANSWER_CACHE = True
+ANSWER_CACHE_THRESHOLD = 0.92
+ANSWER_CACHE_TTL = 7 * 24 * 3600  # seconds
+ANSWER_CACHE_SIZE = 5000
+# Exact-match disk cache for Claude calls: identical prompts skip the network
+LLM_CACHE = True
+LLM_CACHE_SIZE = 10_000
+# Retrieve on the raw question while the rewrite is in flight, then merge with
+# the rewritten query's results
+SPECULATIVE_RETRIEVAL = True
+# With speculative retrieval, retrieve on the raw question first and skip the
+# rewrite altogether when its best chunk is within this (squared L2) distance;
+# None always rewrites, in parallel with the raw retrieval
+SKIP_REWRITE_DISTANCE = None
+# "full": rewrite → retrieve → analyse → respond (three Claude calls)
+# "fast": retrieve on the raw question → one combined analyse-and-respond call
+PIPELINE_PROFILES = ("full", "fast")
+PIPELINE_PROFILE = os.environ.get("PIPELINE_PROFILE", "full")
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
+
+
+def _import_chromadb():
+    # ChromaDB + Pydantic v1 monkey-patch for Python 3.14+
+    if sys.version_info >= (3, 14):
+        import pydantic.v1.fields as _pv1_fields
+        import pydantic.v1.errors as _pv1_errors
+        _orig_set_default_and_type = _pv1_fields.ModelField._set_default_and_type
+
+        def _patched_set_default_and_type(self):
+            try:
+                _orig_set_default_and_type(self)
+            except _pv1_errors.ConfigError:
+                if self.default is not None:
+                    self.type_ = type(self.default)
+                else:
+                    self.type_ = type(None)
+                self.outer_type_ = self.type_
+
+        if _pv1_fields.ModelField._set_default_and_type.__name__ != "_patched_set_default_and_type":
+            _pv1_fields.ModelField._set_default_and_type = _patched_set_default_and_type
+
+    import chromadb
+    return chromadb
+
 
 # ---------------------------------------------------------------------------
 # Shared resources (loaded once)
 # ---------------------------------------------------------------------------
+STARTUP_TIMINGS: dict[str, float] = {}  # seconds spent loading each shared resource
+
+
+def _timed_load(name: str, load):
+    start = time.perf_counter()
+    value = load()
+    STARTUP_TIMINGS[name] = time.perf_counter() - start
+    return value
+
+
 _embedder: SentenceTransformer | None = None
-_collection = None
+_collection: VectorStore | None = None
 _anthropic_client: anthropic.Anthropic | None = None
+_query_cache: QueryEmbeddingCache | None = None
+_lexical_index: BM25Index | None = None
+_answer_caches: dict[str, SemanticAnswerCache] = {}
+_llm_cache: LLMCache | None = None
+_async_anthropic_client: anthropic.AsyncAnthropic | None = None
+# Fast tokenizers refuse concurrent use from several threads
+_encode_lock = threading.Lock()
 
 
 def get_embedder() -> SentenceTransformer:
     global _embedder
     if _embedder is None:
-        _embedder = SentenceTransformer(EMBEDDING_MODEL)
+        _embedder = _timed_load("embedder", load_embedder)
     return _embedder
 
 
-def get_collection():
+def get_query_cache() -> QueryEmbeddingCache:
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = QueryEmbeddingCache(embedding_key(), QUERY_CACHE_SIZE, QUERY_CACHE_PATH)
+    return _query_cache
+
+
+def _encode(texts: list[str]) -> list[list[float]]:
+    embedder = get_embedder()
+    with _encode_lock:
+        return embedder.encode(texts).tolist()
+
+
+def embed_query(query: str) -> list[float]:
+    """Embed a query, skipping the model for recently seen questions."""
+    return get_query_cache().get_or_encode(query, lambda text: _encode([text])[0])
+
+
+def embed_queries(queries: list[str]) -> list[list[float]]:
+    """Embed many queries with one batched `encode` call for all cache misses."""
+    return get_query_cache().get_or_encode_many(queries, _encode)
+
+
+def get_answer_cache(profile: str = PIPELINE_PROFILE) -> SemanticAnswerCache:
+    """Answer cache for one pipeline profile; profiles never share answers."""
+    if profile not in _answer_caches:
+        _answer_caches[profile] = SemanticAnswerCache(
+            f"{embedding_key()}|{CLAUDE_MODEL}|{profile}",
+            ANSWER_CACHE_PATH,
+            ANSWER_CACHE_THRESHOLD,
+            ANSWER_CACHE_TTL,
+            ANSWER_CACHE_SIZE,
+        )
+    return _answer_caches[profile]
+
+
+def get_collection() -> VectorStore:
+    """The vector store selected by VECTOR_BACKEND, ingesting first if empty."""
     global _collection
     if _collection is None:
+        _collection = _timed_load("collection", _open_collection)
+    return _collection
+
+
+def _open_collection() -> VectorStore:
+    if VECTOR_BACKEND == "numpy":
+        chunk_store_path = os.path.join(VECTORSTORE_PATH, CHUNK_STORE_FILE)
+        if not os.path.exists(chunk_store_path):
+            # Incremental, so an existing collection only needs its chunk store written
+            print("Chunk store not found — running ingestion pipeline...")
+            from ingest import ingest
+            ingest(incremental=True)
+        return NumpyVectorStore(chunk_store_path, os.path.join(VECTORSTORE_PATH, SIDECAR_FILE))
+    if VECTOR_BACKEND == "chroma":
+        chromadb = _import_chromadb()
         client = chromadb.PersistentClient(path=VECTORSTORE_PATH)
         try:
-            _collection = client.get_collection(COLLECTION_NAME)
+            return client.get_collection(COLLECTION_NAME)
         except chromadb.errors.NotFoundError:
             print("Collection not found — running ingestion pipeline...")
             from ingest import ingest
             ingest()
-            _collection = client.get_collection(COLLECTION_NAME)
-    return _collection
+            return client.get_collection(COLLECTION_NAME)
+    raise ValueError(f"Unknown VECTOR_BACKEND '{VECTOR_BACKEND}'; expected 'chroma' or 'numpy'.")
+
+
+def get_lexical_index() -> BM25Index | None:
+    """Load the BM25 index on first use; None if ingest has not built one yet.
+    A missing index is not remembered, so one written by a later ingest is
+    picked up on the next call."""
+    global _lexical_index
+    if _lexical_index is None:
+        path = os.path.join(VECTORSTORE_PATH, LEXICAL_INDEX_FILE)
+        if os.path.exists(path):
+            _lexical_index = _timed_load("lexical_index", lambda: BM25Index(path))
+    return _lexical_index
 
 
 def get_anthropic() -> anthropic.Anthropic:
     global _anthropic_client
     if _anthropic_client is None:
-        _anthropic_client = anthropic.Anthropic()
+        def load():
+            import anthropic
+            return anthropic.Anthropic()
+
+        _anthropic_client = _timed_load("anthropic_client", load)
     return _anthropic_client
 
 
+def _import_langgraph():
+    if "langgraph.graph" not in sys.modules:
+        _timed_load("langgraph", lambda: __import__("langgraph.graph"))
+
+
+def get_llm_cache() -> LLMCache:
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_SIZE)
+    return _llm_cache
+
+
+# Token usage of every Claude call made by this process, LLM cache hits excluded
+TOKEN_USAGE = TokenUsage()
+
+
+def token_usage_summary() -> str:
+    usage = TOKEN_USAGE.stats()
+    return (
+        f"Claude tokens over {usage['calls']} call(s): {usage['input_tokens']} input, "
+        f"{usage['cache_read_input_tokens']} cache read, {usage['cache_creation_input_tokens']} cache write, "
+        f"{usage['output_tokens']} output ({usage['cache_read_rate']:.0%} of prompt tokens from cache)"
+    )
+
+
+def _claude_request(prompt: str, max_tokens: int, system: str | None = None) -> dict:
+    request = {
+        "model": CLAUDE_MODEL,
+        "max_tokens": max_tokens,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    if system:
+        # No cache_control breakpoint: every stage's instructions are well
+        # under the 1024-token minimum prefix the API will cache
+        request["system"] = [{"type": "text", "text": system}]
+    return request
+
+
+def call_claude(prompt: str, max_tokens: int, system: str | None = None, use_cache: bool = True) -> str:
+    """Send a single-turn prompt to Claude and return the reply text.
+
+    `system` holds the stage's static instructions, sent as a system block
+    ahead of the per-question `prompt`. Responses are cached on disk by a
+    hash of the full request, so a repeated rewrite or an identical set of
+    retrieved chunks costs no round trip; `use_cache=False` bypasses that
+    cache for this call.
+    """
+    request = _claude_request(prompt, max_tokens, system)
+    key = request_key(**request) if LLM_CACHE and use_cache else None
+    if key is not None:
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            return cached
+
+    response = get_anthropic().messages.create(**request)
+    TOKEN_USAGE.record(response.usage)
+    text = response.content[0].text
+    if key is not None:
+        get_llm_cache().put(key, text)
+    return text
+
+
+def stream_claude(
+    prompt: str, max_tokens: int, system: str | None = None, use_cache: bool = True
+) -> Iterator[str]:
+    """Streaming `call_claude`: yield the reply text as the Messages streaming
+    API produces it. A cached reply is yielded in one piece, and a completed
+    stream is cached like any other call."""
+    request = _claude_request(prompt, max_tokens, system)
+    key = request_key(**request) if LLM_CACHE and use_cache else None
+    if key is not None:
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    with get_anthropic().messages.stream(**request) as stream:
+        for text in stream.text_stream:
+            parts.append(text)
+            yield text
+        TOKEN_USAGE.record(stream.get_final_message().usage)
+    if key is not None:
+        get_llm_cache().put(key, "".join(parts))
+
+
+def _configurable(config: RunnableConfig | None, key: str, default=None):
+    return ((config or {}).get("configurable") or {}).get(key, default)
+
+
+def _token_callback(config: RunnableConfig | None):
+    return _configurable(config, "on_token")
+
+
+def _use_llm_cache(config: RunnableConfig | None) -> bool:
+    return _configurable(config, "llm_cache", True)
+
+
+def generate(
+    prompt: str, max_tokens: int, config: RunnableConfig | None, stage: str, system: str | None = None
+) -> str:
+    """Run a pipeline stage's Claude call, streaming it when the graph was
+    invoked with a token callback, `config["configurable"]["on_token"]`,
+    which receives `(stage, text)` for every text delta. A false
+    `config["configurable"]["llm_cache"]` bypasses the Claude call cache."""
+    on_token = _token_callback(config)
+    use_cache = _use_llm_cache(config)
+    if on_token is None:
+        return call_claude(prompt, max_tokens, system, use_cache)
+    parts = []
+    for text in stream_claude(prompt, max_tokens, system, use_cache):
+        on_token(stage, text)
+        parts.append(text)
+    return "".join(parts)
+
+
+def get_async_anthropic() -> anthropic.AsyncAnthropic:
+    global _async_anthropic_client
+    if _async_anthropic_client is None:
+        def load():
+            import anthropic
+            return anthropic.AsyncAnthropic()
+
+        _async_anthropic_client = _timed_load("async_anthropic_client", load)
+    return _async_anthropic_client
+
+
+async def acall_claude(prompt: str, max_tokens: int, system: str | None = None, use_cache: bool = True) -> str:
+    """Async `call_claude`, sharing its response cache."""
+    request = _claude_request(prompt, max_tokens, system)
+    key = request_key(**request) if LLM_CACHE and use_cache else None
+    if key is not None:
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            return cached
+
+    response = await get_async_anthropic().messages.create(**request)
+    TOKEN_USAGE.record(response.usage)
+    text = response.content[0].text
+    if key is not None:
+        get_llm_cache().put(key, text)
+    return text
+
+
+def warm_up() -> float:
+    """Load the embedder, vector store, lexical index, Claude client and
+    LangGraph in parallel threads, so the first question pays none of it.
+    Model weight loading and file I/O release the GIL, so the loads overlap.
+    Returns the wall-clock seconds taken.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        loads = [pool.submit(load) for load in (
+            get_embedder, get_collection, get_lexical_index, get_anthropic, _import_langgraph
+        )]
+        for load in loads:
+            load.result()
+    return time.perf_counter() - start
+
+
+def report_startup(warm_up_seconds: float | None, first_query_seconds: float, file=None):
+    """Print where start-up and first-query time went."""
+    print("Startup latency:", file=file)
+    print(f"  {'module imports':<18} {IMPORT_SECONDS * 1000:8.0f} ms", file=file)
+    for name, seconds in STARTUP_TIMINGS.items():
+        print(f"  {name:<18} {seconds * 1000:8.0f} ms", file=file)
+    if warm_up_seconds is not None:
+        print(f"  {'warm-up (wall)':<18} {warm_up_seconds * 1000:8.0f} ms", file=file)
+    print(f"  {'first query':<18} {first_query_seconds * 1000:8.0f} ms", file=file)
+
+
 # ---------------------------------------------------------------------------
 # Graph state
 # ---------------------------------------------------------------------------
+def merge_chunks(existing: list[dict], new: list[dict]) -> list[dict]:
+    """Reducer for retrieved chunks: interleave the newer ranking with the
+    earlier one (newer first), dropping repeated chunk ids, up to TOP_K.
+
+    Each list was diversified on its own, so the union is held to the same
+    MAX_CHUNKS_PER_LOG cap and NEAR_DUPLICATE_SIMILARITY check, in merged order.
+    """
+    if not existing or not new:
+        return existing or new
+    merged, seen = [], set()
+    for pair in itertools.zip_longest(new, existing):
+        for chunk in pair:
+            if chunk is not None and chunk["id"] not in seen:
+                seen.add(chunk["id"])
+                merged.append(chunk)
+    picks = mmr_select(
+        np.stack([chunk["embedding"] for chunk in merged]),
+        -np.arange(len(merged), dtype=np.float32),  # keep merged order
+        TOP_K,
+        groups=[chunk["metadata"]["log_id"] for chunk in merged],
+        max_per_group=MAX_CHUNKS_PER_LOG,
+        max_similarity=NEAR_DUPLICATE_SIMILARITY,
+    )
+    return [merged[i] for i in picks]
+
+
 class AgentState(TypedDict):
     original_query: str
     rewritten_query: str
-    retrieved_chunks: Annotated[list[dict], operator.add]
+    retrieved_chunks: Annotated[list[dict], merge_chunks]
+    filters: dict
     knowledge_analysis: str
     final_response: str
+    cached_question: str  # earlier question whose answer was reused, if any
 
 
 # ---------------------------------------------------------------------------
 # Agent 1 — Retrieval Agent
 # ---------------------------------------------------------------------------
+def expand_log_ids(meta: dict) -> list[str]:
+    """Log ids a chunk covers. A deduplicated chunk (ingest --dedupe) stands in
+    for every log that produced the same text; only the last ingest.MAX_LOG_IDS are
+    listed, and its `occurrences` metadata holds the full count."""
+    return meta["log_ids"].split(",") if meta.get("log_ids") else [meta["log_id"]]
+
+
+def _relax(where: dict) -> dict | None:
+    """Drop the last top-level condition of a filter built by `extract_filters`."""
+    return join_conditions(split_conditions(where)[:-1])
+
+
+def search_chunks_many(
+    queries: list[str],
+    wheres: list[dict | None],
+    n_results: int = TOP_K,
+    embeddings: list[list[float]] | None = None,
+    applied_wheres: list | None = None,
+) -> list[list[dict]]:
+    """Vector search for many queries, each pre-filtered by its own `where`.
+
+    Queries sharing a filter go to the vector store as one multi-query
+    `query` call. If a filter matches nothing, its least specific conditions
+    are dropped one at a time (chunk type, then date, then severity, in the
+    order `extract_filters` emits them) so an over-eager filter never leaves
+    the pipeline without context. Pass a list as `applied_wheres` to get the
+    filter each query was finally searched with. Chunks carry their
+    `embedding` for reranking.
+    """
+    embeddings = embeddings if embeddings is not None else embed_queries(queries)
+    applied = list(wheres)
+    groups: dict[str, list[int]] = {}
+    for i, where in enumerate(wheres):
+        groups.setdefault(json.dumps(where, sort_keys=True), []).append(i)
+
+    found: list[list[dict]] = [[] for _ in queries]
+    empty = []
+    for members in groups.values():
+        where = wheres[members[0]]
+        results = get_collection().query(
+            query_embeddings=[embeddings[i] for i in members],
+            n_results=n_results,
+            where=where,
+            include=["documents", "metadatas", "distances", "embeddings"],
+        )
+        for row, i in enumerate(members):
+            if where and not results["ids"][row]:
+                empty.append(i)
+                continue
+            for chunk_id, doc, meta, dist, embedding in zip(
+                results["ids"][row],
+                results["documents"][row],
+                results["metadatas"][row],
+                results["distances"][row],
+                results["embeddings"][row],
+            ):
+                found[i].append({
+                    "id": chunk_id,
+                    "text": doc,
+                    "metadata": meta,
+                    "distance": dist,
+                    "log_ids": expand_log_ids(meta),
+                    "embedding": np.asarray(embedding, dtype=np.float32),
+                })
+
+    if empty:
+        relaxed_wheres = []
+        relaxed = search_chunks_many(
+            [queries[i] for i in empty],
+            [_relax(wheres[i]) for i in empty],
+            n_results,
+            [embeddings[i] for i in empty],
+            relaxed_wheres,
+        )
+        for i, chunks, where in zip(empty, relaxed, relaxed_wheres):
+            found[i] = chunks
+            applied[i] = where
+    if applied_wheres is not None:
+        applied_wheres[:] = applied
+    return found
+
+
+def search_chunks(query: str, where: dict | None = None, n_results: int = TOP_K) -> list[dict]:
+    """Vector search for one query; see `search_chunks_many`."""
+    return search_chunks_many([query], [where], n_results)[0]
+
+
+def _fuse(query: str, where: dict | None, vector_hits: list[dict], lexical_ids: list[str]) -> tuple[list[dict], list[float]]:
+    """Reciprocal rank fusion of one query's rankings → (chunks, scores), best first."""
+    scores: dict[str, float] = {}
+    for ranking in ([chunk["id"] for chunk in vector_hits], lexical_ids):
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank)
+
+    by_id = {chunk["id"]: chunk for chunk in vector_hits}
+    missing = [chunk_id for chunk_id in lexical_ids if chunk_id not in by_id]
+    if missing:
+        fetched = get_collection().get(ids=missing, where=where, include=["documents", "metadatas", "embeddings"])
+        if fetched["ids"]:
+            query_vector = np.asarray(embed_query(query), dtype=np.float32)
+            # ChromaDB's default space is squared L2, so report the same distance
+            embeddings = np.asarray(fetched["embeddings"], dtype=np.float32)
+            distances = ((embeddings - query_vector) ** 2).sum(axis=1)
+            for chunk_id, doc, meta, dist, embedding in zip(
+                fetched["ids"], fetched["documents"], fetched["metadatas"], distances, embeddings
+            ):
+                by_id[chunk_id] = {
+                    "id": chunk_id,
+                    "text": doc,
+                    "metadata": meta,
+                    "distance": float(dist),
+                    "log_ids": expand_log_ids(meta),
+                    "embedding": embedding,
+                }
+
+    ranked = sorted((chunk_id for chunk_id in scores if chunk_id in by_id), key=scores.get, reverse=True)
+    return [by_id[chunk_id] for chunk_id in ranked], [scores[chunk_id] for chunk_id in ranked]
+
+
+def diversify(chunks: list[dict], relevance: list[float], n_results: int) -> list[dict]:
+    """Pick up to `n_results` of `chunks` by MMR, capped per log and with
+    near-duplicates dropped. The picks keep their `embedding`, which
+    `merge_chunks` needs to hold a merged ranking to the same limits."""
+    if not chunks:
+        return []
+    picks = mmr_select(
+        np.stack([chunk["embedding"] for chunk in chunks]),
+        relevance,
+        n_results,
+        MMR_LAMBDA,
+        groups=[chunk["metadata"]["log_id"] for chunk in chunks],
+        max_per_group=MAX_CHUNKS_PER_LOG,
+        max_similarity=NEAR_DUPLICATE_SIMILARITY,
+    )
+    return [chunks[i] for i in picks]
+
+
+def hybrid_search_many(
+    queries: list[str],
+    wheres: list[dict | None],
+    n_results: int = TOP_K,
+    lexical_queries: list[str] | None = None,
+    applied_wheres: list | None = None,
+) -> list[list[dict]]:
+    """Fuse BM25 and vector rankings with reciprocal rank fusion, per query.
+
+    Exact terms such as equipment ids and part names are matched by the
+    lexical side, which dense embeddings handle poorly. Lexical-only hits are
+    fetched from the vector store (subject to the same `where` filter) and
+    given their true vector distance so downstream code sees the usual chunk
+    shape.
+
+    The top RERANK_CANDIDATES are then narrowed to `n_results` by `diversify`.
+    Without a lexical index, cosine similarity to the query is the relevance.
+    `applied_wheres` is as for `search_chunks_many`; lexical hits are held to
+    the same, possibly relaxed, filter.
+    """
+    pool_size = max(n_results, RERANK_CANDIDATES)
+    get_collection()  # ingests a fresh store, which also writes the lexical index
+    index = get_lexical_index() if HYBRID_SEARCH else None
+    applied = []
+    if index is None:
+        pools = search_chunks_many(queries, wheres, pool_size, applied_wheres=applied)
+        # Squared L2 between unit vectors is 2 - 2·cosine
+        relevances = [[1.0 - chunk["distance"] / 2 for chunk in pool] for pool in pools]
+    else:
+        vector_hits = search_chunks_many(
+            queries, wheres, max(HYBRID_CANDIDATES, pool_size), applied_wheres=applied
+        )
+        lexical_queries = lexical_queries or queries
+        pools, relevances = [], []
+        for query, where, hits, lexical in zip(queries, applied, vector_hits, lexical_queries):
+            lexical_ids = [chunk_id for chunk_id, _ in index.search(lexical, max(HYBRID_CANDIDATES, pool_size))]
+            chunks, scores = _fuse(query, where, hits, lexical_ids)
+            pools.append(chunks[:pool_size])
+            # Scale fused scores so the best is 1, comparable with cosine similarity
+            relevances.append([score / scores[0] for score in scores[:pool_size]] if scores else [])
+    if applied_wheres is not None:
+        applied_wheres[:] = applied
+    return [diversify(pool, relevance, n_results) for pool, relevance in zip(pools, relevances)]
+
+
+def hybrid_search(
+    query: str,
+    where: dict | None = None,
+    n_results: int = TOP_K,
+    lexical_query: str | None = None,
+    applied_wheres: list | None = None,
+) -> list[dict]:
+    """Hybrid search for one query; see `hybrid_search_many`."""
+    return hybrid_search_many([query], [where], n_results, [lexical_query or query], applied_wheres)[0]
+
+
 def retrieval_agent(state: AgentState) -> dict:
-    """Query ChromaDB with the rewritten query and return relevant chunks."""
+    """Query ChromaDB with the rewritten query and return relevant chunks.
+
+    Structured filters (equipment type, severity, date range, chunk type) are
+    read from the technician's original wording, which the rewrite may drop.
+    Lexical matching uses both wordings so exact ids survive the rewrite.
+    """
     query = state.get("rewritten_query") or state["original_query"]
+    where = extract_filters(state["original_query"])
+    applied = []
+    chunks = hybrid_search(query, where, lexical_query=f"{state['original_query']} {query}", applied_wheres=applied)
+    return {"retrieved_chunks": chunks, "filters": applied[0] or {}}
 
-    embedding = get_embedder().encode([query])[0].tolist()
-    results = get_collection().query(
-        query_embeddings=[embedding],
-        n_results=TOP_K,
-        include=["documents", "metadatas", "distances"],
-    )
 
-    chunks = []
-    for doc, meta, dist in zip(
-        results["documents"][0],
-        results["metadatas"][0],
-        results["distances"][0],
-    ):
-        chunks.append({
-            "text": doc,
-            "metadata": meta,
-            "distance": dist,
-        })
+def speculative_retrieval_node(state: AgentState) -> dict:
+    """Retrieve on the technician's own wording, without waiting for the rewrite.
 
-    return {"retrieved_chunks": chunks}
+    Its chunks are merged with the rewritten query's by `merge_chunks`.
+    """
+    query = state["original_query"]
+    applied = []
+    chunks = hybrid_search(query, extract_filters(query), applied_wheres=applied)
+    return {"retrieved_chunks": chunks, "filters": applied[0] or {}}
+
+
+def raw_results_confident(chunks: list[dict]) -> bool:
+    """True when SKIP_REWRITE_DISTANCE is set and the raw question's best chunk is within it."""
+    return (
+        SKIP_REWRITE_DISTANCE is not None
+        and bool(chunks)
+        and min(chunk["distance"] for chunk in chunks) <= SKIP_REWRITE_DISTANCE
+    )
 
 
 # ---------------------------------------------------------------------------
 # Agent 2 — Knowledge Extraction Agent
 # ---------------------------------------------------------------------------
-KNOWLEDGE_PROMPT = """You are an expert heavy vehicle maintenance analyst. You have been given
+KNOWLEDGE_SYSTEM = """You are an expert heavy vehicle maintenance analyst. You will be given
 retrieved maintenance log chunks related to a technician's query.
 
-QUERY: {query}
-
-RETRIEVED MAINTENANCE DATA:
-{chunks}
-
 Analyse the retrieved data and provide:
 1. **Fault Patterns**: Common fault patterns relevant to this query across equipment types.
 2. **Diagnostic Heuristics**: Step-by-step diagnostic approach based on historical data.
@@ -135,59 +690,52 @@ Analyse the retrieved data and provide:
 Be specific — reference equipment types, part numbers, and repair times from the data.
 Structure your analysis clearly with headers."""
 
+KNOWLEDGE_PROMPT = """QUERY: {query}
 
-def knowledge_extraction_agent(state: AgentState) -> dict:
-    """Use Claude to analyse retrieved chunks and extract fault patterns."""
+RETRIEVED MAINTENANCE DATA:
+{chunks}"""
+
+
+def _knowledge_prompt(state: AgentState) -> str:
     query = state.get("rewritten_query") or state["original_query"]
-    chunks = state["retrieved_chunks"]
-
-    chunks_text = ""
-    for i, chunk in enumerate(chunks, 1):
-        meta = chunk["metadata"]
-        chunks_text += (
-            f"\n--- Chunk {i} (type: {meta.get('chunk_type', 'unknown')}, "
-            f"equipment: {meta.get('equipment_type', 'unknown')}, "
-            f"severity: {meta.get('severity', 'unknown')}, "
-            f"distance: {chunk['distance']:.4f}) ---\n"
-            f"{chunk['text']}\n"
-        )
+    context, _ = build_context(state["retrieved_chunks"], CONTEXT_TOKEN_BUDGET)
+    return KNOWLEDGE_PROMPT.format(query=query, chunks=context)
 
-    prompt = KNOWLEDGE_PROMPT.format(query=query, chunks=chunks_text)
 
-    response = get_anthropic().messages.create(
-        model=CLAUDE_MODEL,
-        max_tokens=2048,
-        messages=[{"role": "user", "content": prompt}],
-    )
+def knowledge_extraction_agent(state: AgentState, config: RunnableConfig = None) -> dict:
+    """Use Claude to analyse retrieved chunks and extract fault patterns."""
+    analysis = generate(_knowledge_prompt(state), 2048, config, "knowledge_extraction", KNOWLEDGE_SYSTEM)
+    return {"knowledge_analysis": analysis}
 
-    analysis = response.content[0].text
+
+async def aknowledge_extraction_agent(state: AgentState, config: RunnableConfig = None) -> dict:
+    """Async `knowledge_extraction_agent`."""
+    analysis = await acall_claude(
+        _knowledge_prompt(state), max_tokens=2048, system=KNOWLEDGE_SYSTEM, use_cache=_use_llm_cache(config)
+    )
     return {"knowledge_analysis": analysis}
 
 
 # ---------------------------------------------------------------------------
 # Agent 3 — Query Agent (orchestrator)
 # ---------------------------------------------------------------------------
-REWRITE_PROMPT = """You are a maintenance knowledge system query optimiser. A junior engineer
-has asked the following question:
+REWRITE_SYSTEM = """You are a maintenance knowledge system query optimiser. A junior engineer
+will give you their question.
 
-"{query}"
-
-Rewrite this as a precise technical query optimised for searching a vector database of heavy
+Rewrite it as a precise technical query optimised for searching a vector database of heavy
 vehicle maintenance logs. The database contains fault descriptions, symptoms, diagnostic steps,
 root causes, resolutions, parts replaced, and engineer notes for trucks and armoured vehicles.
 
 Focus on key technical terms, fault types, symptoms, and equipment categories.
 Return ONLY the rewritten query, nothing else."""
 
-RESPONSE_PROMPT = """You are a helpful senior maintenance engineer assisting a junior technician.
+REWRITE_PROMPT = 'The junior engineer asked: "{query}"'
 
-The junior engineer asked: "{query}"
+RESPONSE_SYSTEM = """You are a helpful senior maintenance engineer assisting a junior technician.
+You will be given the junior engineer's question and an analysis of our maintenance knowledge
+base for it.
 
-Based on analysis of our maintenance knowledge base, here is what was found:
-
-{analysis}
-
-Now write a clear, actionable response for the junior engineer. Use plain language they can
+Write a clear, actionable response for the junior engineer. Use plain language they can
 understand and act on. Include:
 - What the most likely problem is
 - How to diagnose it step by step
@@ -196,103 +744,694 @@ understand and act on. Include:
 
 Keep it practical and direct. If there are multiple possible causes, rank them by likelihood."""
 
+RESPONSE_PROMPT = """The junior engineer asked: "{query}"
+
+Based on analysis of our maintenance knowledge base, here is what was found:
+
+{analysis}"""
+
 
-def query_rewrite_node(state: AgentState) -> dict:
+def query_rewrite_node(state: AgentState, config: RunnableConfig = None) -> dict:
     """Rewrite the user's plain-language question for better retrieval."""
     query = state["original_query"]
 
-    response = get_anthropic().messages.create(
-        model=CLAUDE_MODEL,
-        max_tokens=256,
-        messages=[{"role": "user", "content": REWRITE_PROMPT.format(query=query)}],
-    )
+    rewritten = call_claude(
+        REWRITE_PROMPT.format(query=query), max_tokens=256, system=REWRITE_SYSTEM, use_cache=_use_llm_cache(config)
+    ).strip()
+    return {"rewritten_query": rewritten}
 
-    rewritten = response.content[0].text.strip()
+
+async def aquery_rewrite_node(state: AgentState, config: RunnableConfig = None) -> dict:
+    """Async `query_rewrite_node`."""
+    query = state["original_query"]
+
+    rewritten = await acall_claude(
+        REWRITE_PROMPT.format(query=query), max_tokens=256, system=REWRITE_SYSTEM, use_cache=_use_llm_cache(config)
+    )
+    rewritten = rewritten.strip()
     return {"rewritten_query": rewritten}
 
 
-def response_synthesis_node(state: AgentState) -> dict:
+def response_synthesis_node(state: AgentState, config: RunnableConfig = None) -> dict:
     """Synthesise the final plain-language response for the junior engineer."""
     query = state["original_query"]
     analysis = state["knowledge_analysis"]
 
-    response = get_anthropic().messages.create(
-        model=CLAUDE_MODEL,
-        max_tokens=2048,
-        messages=[{"role": "user", "content": RESPONSE_PROMPT.format(
-            query=query, analysis=analysis
-        )}],
-    )
+    prompt = RESPONSE_PROMPT.format(query=query, analysis=analysis)
+    final = generate(prompt, 2048, config, "response_synthesis", RESPONSE_SYSTEM)
+    return {"final_response": final}
+
+
+async def aresponse_synthesis_node(state: AgentState, config: RunnableConfig = None) -> dict:
+    """Async `response_synthesis_node`."""
+    query = state["original_query"]
+    analysis = state["knowledge_analysis"]
 
-    final = response.content[0].text
+    prompt = RESPONSE_PROMPT.format(query=query, analysis=analysis)
+    final = await acall_claude(prompt, max_tokens=2048, system=RESPONSE_SYSTEM, use_cache=_use_llm_cache(config))
     return {"final_response": final}
 
 
+# ---------------------------------------------------------------------------
+# Fast profile — combined analysis and response
+# ---------------------------------------------------------------------------
+COMBINED_SYSTEM = """You are a senior heavy vehicle maintenance engineer assisting a junior technician.
+You will be given the junior engineer's question and retrieved maintenance log chunks.
+
+First, inside <analysis></analysis> tags, analyse the retrieved data:
+1. **Fault Patterns**: Common fault patterns relevant to this query across equipment types.
+2. **Diagnostic Heuristics**: Step-by-step diagnostic approach based on historical data.
+3. **Root Causes**: Most likely root causes ranked by frequency in the data.
+4. **Recommended Resolutions**: What worked before, including parts and repair times.
+5. **Warnings & Notes**: Any engineer notes or recurring issues to watch for.
+Be specific — reference equipment types, part numbers, and repair times from the data.
+
+Then, inside <response></response> tags, write a clear, actionable response for the junior
+engineer based on that analysis. Use plain language they can understand and act on. Include:
+- What the most likely problem is
+- How to diagnose it step by step
+- What the fix usually involves (parts, tools, time)
+- Any safety warnings or things to watch out for
+
+Keep it practical and direct. If there are multiple possible causes, rank them by likelihood."""
+
+COMBINED_PROMPT = """The junior engineer asked: "{query}"
+
+RETRIEVED MAINTENANCE DATA:
+{chunks}"""
+
+_SECTION_TAGS = {
+    "<analysis>": "knowledge_extraction",
+    "</analysis>": None,
+    "<response>": "response_synthesis",
+    "</response>": None,
+}
+
+
+def split_sections(text: str) -> tuple[str, str]:
+    """(analysis, response) from a combined reply. A reply without a
+    <response> section is treated as all response."""
+    def section(tag: str) -> str | None:
+        start = text.find(f"<{tag}>")
+        if start == -1:
+            return None
+        start += len(tag) + 2
+        end = text.find(f"</{tag}>", start)
+        return text[start : end if end != -1 else None].strip()
+
+    response = section("response")
+    if response is None:
+        return section("analysis") or "", text.strip()
+    return section("analysis") or "", response
+
+
+class SectionRouter:
+    """Forward streamed combined-reply text to `on_token(stage, text)`, routing
+    the <analysis> section to "knowledge_extraction" and the <response>
+    section to "response_synthesis" and dropping the tags themselves."""
+
+    _HOLD = max(len(tag) for tag in _SECTION_TAGS) - 1
+
+    def __init__(self, on_token):
+        self.on_token = on_token
+        self.stage = None
+        self.buffer = ""
+        self.section_start = False
+
+    def _emit(self, text: str):
+        if self.section_start:
+            text = text.lstrip()
+        if text and self.stage is not None:
+            self.section_start = False
+            self.on_token(self.stage, text)
+
+    def feed(self, text: str):
+        self.buffer += text
+        while True:
+            found = [(self.buffer.find(tag), tag) for tag in _SECTION_TAGS if tag in self.buffer]
+            if not found:
+                break
+            index, tag = min(found)
+            self._emit(self.buffer[:index])
+            self.stage = _SECTION_TAGS[tag]
+            self.section_start = True
+            self.buffer = self.buffer[index + len(tag):]
+        # Hold back a possible partial tag at the end of the buffer
+        cut = self.buffer.rfind("<", max(0, len(self.buffer) - self._HOLD))
+        if cut == -1:
+            cut = len(self.buffer)
+        self._emit(self.buffer[:cut])
+        self.buffer = self.buffer[cut:]
+
+    def close(self):
+        self._emit(self.buffer)
+        self.buffer = ""
+
+
+def _combined_prompt(state: AgentState) -> str:
+    context, _ = build_context(state["retrieved_chunks"], CONTEXT_TOKEN_BUDGET)
+    return COMBINED_PROMPT.format(query=state["original_query"], chunks=context)
+
+
+def combined_answer_node(state: AgentState, config: RunnableConfig = None) -> dict:
+    """Fast profile: analyse the chunks and answer the technician in one Claude call."""
+    prompt = _combined_prompt(state)
+    on_token = _token_callback(config)
+    use_cache = _use_llm_cache(config)
+    if on_token is None:
+        text = call_claude(prompt, max_tokens=4096, system=COMBINED_SYSTEM, use_cache=use_cache)
+    else:
+        router = SectionRouter(on_token)
+        parts = []
+        for delta in stream_claude(prompt, max_tokens=4096, system=COMBINED_SYSTEM, use_cache=use_cache):
+            router.feed(delta)
+            parts.append(delta)
+        router.close()
+        text = "".join(parts)
+
+    analysis, response = split_sections(text)
+    return {"knowledge_analysis": analysis, "final_response": response}
+
+
+async def acombined_answer_node(state: AgentState, config: RunnableConfig = None) -> dict:
+    """Async `combined_answer_node`."""
+    analysis, response = split_sections(await acall_claude(
+        _combined_prompt(state), max_tokens=4096, system=COMBINED_SYSTEM, use_cache=_use_llm_cache(config)
+    ))
+    return {"knowledge_analysis": analysis, "final_response": response}
+
+
+# ---------------------------------------------------------------------------
+# Semantic answer cache
+# ---------------------------------------------------------------------------
+def _filters_key(question: str) -> str:
+    return json.dumps(extract_filters(question) or {}, sort_keys=True)
+
+
+def answer_cache_lookup_node(state: AgentState, config: RunnableConfig = None) -> dict:
+    """Reuse the answer to a near-identical earlier question, if there is one.
+    Answers are kept per pipeline profile, `config["configurable"]["profile"]`."""
+    if not ANSWER_CACHE:
+        return {"cached_question": ""}
+    question = state["original_query"]
+    hit = get_answer_cache(_configurable(config, "profile", PIPELINE_PROFILE)).lookup(
+        embed_query(question), _filters_key(question), read_collection_version(VECTORSTORE_PATH)
+    )
+    if hit is None:
+        return {"cached_question": ""}
+    return {
+        "cached_question": hit["question"],
+        "knowledge_analysis": hit["analysis"],
+        "final_response": hit["response"],
+    }
+
+
+def answer_cache_store_node(state: AgentState, config: RunnableConfig = None) -> dict:
+    """Remember a freshly synthesised answer for future near-duplicates."""
+    if ANSWER_CACHE and state["final_response"]:
+        question = state["original_query"]
+        get_answer_cache(_configurable(config, "profile", PIPELINE_PROFILE)).store(
+            question,
+            embed_query(question),
+            _filters_key(question),
+            read_collection_version(VECTORSTORE_PATH),
+            state["knowledge_analysis"],
+            state["final_response"],
+        )
+    return {}
+
+
+# ---------------------------------------------------------------------------
+# Async nodes
+# ---------------------------------------------------------------------------
+def _in_executor(node):
+    """Async wrapper running a blocking node (embedding, vector store, SQLite)
+    on the event loop's default thread pool."""
+    takes_config = "config" in inspect.signature(node).parameters
+
+    async def run(state: AgentState, config: RunnableConfig = None) -> dict:
+        args = (state, config) if takes_config else (state,)
+        return await asyncio.get_running_loop().run_in_executor(None, node, *args)
+
+    run.__name__ = f"a{node.__name__}"
+    return run
+
+
+aretrieval_agent = _in_executor(retrieval_agent)
+aspeculative_retrieval_node = _in_executor(speculative_retrieval_node)
+aanswer_cache_lookup_node = _in_executor(answer_cache_lookup_node)
+aanswer_cache_store_node = _in_executor(answer_cache_store_node)
+
+
 # ---------------------------------------------------------------------------
 # Build the LangGraph
 # ---------------------------------------------------------------------------
-def build_graph():
+def build_graph(
+    use_async: bool = False,
+    profile: str = PIPELINE_PROFILE,
+    answer_cache: bool = True,
+    llm_cache: bool = True,
+):
+    """Compile the pipeline graph for a profile in PIPELINE_PROFILES. With
+    `use_async`, every node is a coroutine and the graph must be driven with
+    `ainvoke`. `answer_cache=False` leaves out the semantic answer cache and
+    `llm_cache=False` bypasses the Claude call cache for this graph only;
+    either cache is also off when its module-level switch is."""
+    if profile not in PIPELINE_PROFILES:
+        raise ValueError(f"Unknown pipeline profile {profile!r}; expected one of {PIPELINE_PROFILES}")
+    from langgraph.graph import StateGraph, START, END
+
     graph = StateGraph(AgentState)
 
-    # Add nodes
-    graph.add_node("query_rewrite", query_rewrite_node)
-    graph.add_node("retrieval", retrieval_agent)
-    graph.add_node("knowledge_extraction", knowledge_extraction_agent)
-    graph.add_node("response_synthesis", response_synthesis_node)
+    if use_async:
+        nodes = {
+            "answer_cache_lookup": aanswer_cache_lookup_node,
+            "query_rewrite": aquery_rewrite_node,
+            "retrieval": aretrieval_agent,
+            "speculative_retrieval": aspeculative_retrieval_node,
+            "knowledge_extraction": aknowledge_extraction_agent,
+            "response_synthesis": aresponse_synthesis_node,
+            "combined_answer": acombined_answer_node,
+            "answer_cache_store": aanswer_cache_store_node,
+        }
+    else:
+        nodes = {
+            "answer_cache_lookup": answer_cache_lookup_node,
+            "query_rewrite": query_rewrite_node,
+            "retrieval": retrieval_agent,
+            "speculative_retrieval": speculative_retrieval_node,
+            "knowledge_extraction": knowledge_extraction_agent,
+            "response_synthesis": response_synthesis_node,
+            "combined_answer": combined_answer_node,
+            "answer_cache_store": answer_cache_store_node,
+        }
+
+    # START → cache lookup → (hit: END) → first step … last step → cache store → END
+    #   full: → rewrite → retrieve → extract → synthesise →
+    #   fast: → retrieve on the raw question → combined answer →
+    # With SPECULATIVE_RETRIEVAL, the full profile's retrieval on the raw question
+    # runs alongside the rewrite, or before it when SKIP_REWRITE_DISTANCE may skip the rewrite.
+    if profile == "fast":
+        nodes["retrieval"] = nodes.pop("speculative_retrieval")
+        for name in ("query_rewrite", "knowledge_extraction", "response_synthesis"):
+            del nodes[name]
+        first_step, last_step = "retrieval", "combined_answer"
+    else:
+        del nodes["combined_answer"]
+        if not SPECULATIVE_RETRIEVAL:
+            first_step = "query_rewrite"
+            del nodes["speculative_retrieval"]
+        elif SKIP_REWRITE_DISTANCE is None:
+            first_step = ["query_rewrite", "speculative_retrieval"]
+        else:
+            first_step = "speculative_retrieval"
+        last_step = "response_synthesis"
+    if not answer_cache:
+        del nodes["answer_cache_lookup"], nodes["answer_cache_store"]
 
-    # Define edges: START → rewrite → retrieve → extract → synthesise → END
-    graph.add_edge(START, "query_rewrite")
-    graph.add_edge("query_rewrite", "retrieval")
+    for name, node in nodes.items():
+        graph.add_node(name, node)
+
+    if answer_cache:
+        graph.add_edge(START, "answer_cache_lookup")
+        graph.add_conditional_edges(
+            "answer_cache_lookup",
+            lambda state: END if state.get("cached_question") else first_step,
+            [name for name in ("retrieval", "query_rewrite", "speculative_retrieval") if name in nodes] + [END],
+        )
+        graph.add_edge(last_step, "answer_cache_store")
+        graph.add_edge("answer_cache_store", END)
+    else:
+        for step in first_step if isinstance(first_step, list) else [first_step]:
+            graph.add_edge(START, step)
+        graph.add_edge(last_step, END)
+
+    if profile == "fast":
+        graph.add_edge("retrieval", "combined_answer")
+        return graph.compile().with_config(configurable={"profile": profile, "llm_cache": llm_cache})
+
+    if first_step == "speculative_retrieval":
+        graph.add_conditional_edges(
+            "speculative_retrieval",
+            lambda state: "knowledge_extraction" if raw_results_confident(state["retrieved_chunks"]) else "query_rewrite",
+            ["knowledge_extraction", "query_rewrite"],
+        )
+        graph.add_edge("query_rewrite", "retrieval")
+    elif SPECULATIVE_RETRIEVAL:
+        graph.add_edge(["query_rewrite", "speculative_retrieval"], "retrieval")
+    else:
+        graph.add_edge("query_rewrite", "retrieval")
     graph.add_edge("retrieval", "knowledge_extraction")
     graph.add_edge("knowledge_extraction", "response_synthesis")
-    graph.add_edge("response_synthesis", END)
 
-    return graph.compile()
+    return graph.compile().with_config(configurable={"profile": profile, "llm_cache": llm_cache})
 
 
 # ---------------------------------------------------------------------------
 # CLI entry point
 # ---------------------------------------------------------------------------
-def run_query(question: str) -> str:
-    """Run a question through the multi-agent pipeline and return the response."""
-    app = build_graph()
-    result = app.invoke({
+def initial_state(question: str) -> AgentState:
+    return {
         "original_query": question,
         "rewritten_query": "",
         "retrieved_chunks": [],
+        "filters": {},
         "knowledge_analysis": "",
         "final_response": "",
-    })
+        "cached_question": "",
+    }
+
+
+def run_query(question: str, profile: str = PIPELINE_PROFILE) -> str:
+    """Run a question through the multi-agent pipeline and return the response."""
+    app = build_graph(profile=profile)
+    result = app.invoke(initial_state(question))
+    return result["final_response"]
+
+
+async def arun_query(question: str, profile: str = PIPELINE_PROFILE) -> str:
+    """Async `run_query`."""
+    result = await build_graph(use_async=True, profile=profile).ainvoke(initial_state(question))
     return result["final_response"]
 
 
+async def arun_queries(
+    questions: list[str],
+    concurrency: int = ASYNC_CONCURRENCY,
+    profile: str = PIPELINE_PROFILE,
+    answer_cache: bool = True,
+    llm_cache: bool = True,
+) -> list[dict]:
+    """Answer many questions on one event loop, at most `concurrency` in flight.
+
+    Claude calls are awaited on the async client while embedding and vector
+    search run on the loop's thread pool, so one process overlaps many
+    questions' network waits. As in `run_queries`, a failed Claude call is
+    recorded under "error" instead of failing the batch. The cache flags are
+    as for `build_graph`. Returns one final state per question, in order.
+    """
+    import anthropic
+
+    # Load shared resources once, before concurrent first use
+    await asyncio.to_thread(warm_up)
+    app = build_graph(use_async=True, profile=profile, answer_cache=answer_cache, llm_cache=llm_cache)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def answer(question: str) -> dict:
+        async with limit:
+            try:
+                return await app.ainvoke(initial_state(question))
+            except anthropic.APIError as exc:
+                return {**initial_state(question), "error": str(exc)}
+
+    return await asyncio.gather(*(answer(question) for question in questions))
+
+
+def run_queries(
+    questions: list[str],
+    concurrency: int = LLM_CONCURRENCY,
+    profile: str = PIPELINE_PROFILE,
+    answer_cache: bool = True,
+    llm_cache: bool = True,
+) -> list[dict]:
+    """Run many questions through the pipeline as one batch.
+
+    The stages are those of `build_graph`, but retrieval is batched: every
+    rewritten (or, speculatively, raw) query is embedded in one `encode` call
+    and searched with multi-query vector store calls. Claude calls run on up to `concurrency`
+    threads. A question whose Claude call fails gets an "error" entry rather
+    than failing the batch. Questions answered from the semantic answer cache
+    skip every Claude call; the cache flags are as for `build_graph`. Returns
+    one final state per question, in order.
+    """
+    import anthropic
+
+    if profile not in PIPELINE_PROFILES:
+        raise ValueError(f"Unknown pipeline profile {profile!r}; expected one of {PIPELINE_PROFILES}")
+
+    states = [initial_state(question) for question in questions]
+
+    config = {"configurable": {"profile": profile, "llm_cache": llm_cache}}
+    if answer_cache:
+        if ANSWER_CACHE:
+            # One encode call for every question; each lookup then hits the query embedding cache
+            embed_queries(questions)
+        for state in states:
+            state.update(answer_cache_lookup_node(state, config))
+    pending = [state for state in states if not state["cached_question"]]
+
+    def run_node(node, state):
+        if state.get("error"):
+            return
+        try:
+            state.update(node(state, config))
+        except anthropic.APIError as exc:
+            state["error"] = f"{node.__name__}: {exc}"
+
+    def analyse_and_respond(state):
+        run_node(knowledge_extraction_agent, state)
+        run_node(response_synthesis_node, state)
+
+    def retrieve_raw(batch):
+        wheres = []
+        found = hybrid_search_many(
+            [state["original_query"] for state in batch],
+            [extract_filters(state["original_query"]) for state in batch],
+            applied_wheres=wheres,
+        )
+        for state, where, chunks in zip(batch, wheres, found):
+            state["retrieved_chunks"] = chunks
+            state["filters"] = where or {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        to_rewrite = pending
+        if profile == "fast":
+            retrieve_raw(pending)
+            to_rewrite = []
+        elif SPECULATIVE_RETRIEVAL and SKIP_REWRITE_DISTANCE is not None:
+            retrieve_raw(pending)
+            to_rewrite = [state for state in pending if not raw_results_confident(state["retrieved_chunks"])]
+            list(pool.map(lambda state: run_node(query_rewrite_node, state), to_rewrite))
+        elif SPECULATIVE_RETRIEVAL:
+            rewrites = [pool.submit(run_node, query_rewrite_node, state) for state in to_rewrite]
+            retrieve_raw(pending)
+            for rewrite in rewrites:
+                rewrite.result()
+        else:
+            list(pool.map(lambda state: run_node(query_rewrite_node, state), to_rewrite))
+
+        rewritten = [state for state in to_rewrite if not state.get("error")]
+        wheres = []
+        found = hybrid_search_many(
+            [state["rewritten_query"] or state["original_query"] for state in rewritten],
+            [extract_filters(state["original_query"]) for state in rewritten],
+            lexical_queries=[f"{state['original_query']} {state['rewritten_query']}" for state in rewritten],
+            applied_wheres=wheres,
+        )
+        for state, where, chunks in zip(rewritten, wheres, found):
+            state["retrieved_chunks"] = merge_chunks(state["retrieved_chunks"], chunks)
+            state["filters"] = where or {}
+
+        live = [state for state in pending if not state.get("error")]
+        if profile == "fast":
+            list(pool.map(lambda state: run_node(combined_answer_node, state), live))
+        else:
+            list(pool.map(analyse_and_respond, live))
+
+    for state in live:
+        if answer_cache and not state.get("error"):
+            answer_cache_store_node(state, config)
+    return states
+
+
+def compare_profiles(questions: list[str], profiles=PIPELINE_PROFILES, file=None) -> dict[str, list[float]]:
+    """Time every question end to end under each pipeline profile and print
+    mean / p50 / max latency per profile. The answer and Claude call caches
+    are bypassed so every run pays for its Claude calls. Returns
+    {profile: [seconds per question]}."""
+    warm_up()
+    latencies = {}
+    for profile in profiles:
+        app = build_graph(profile=profile, answer_cache=False, llm_cache=False)
+        latencies[profile] = []
+        for question in questions:
+            start = time.perf_counter()
+            app.invoke(initial_state(question))
+            latencies[profile].append(time.perf_counter() - start)
+
+    print(f"Pipeline profile latency over {len(questions)} question(s):", file=file)
+    for profile, seconds in latencies.items():
+        seconds = np.array(seconds) * 1000
+        print(
+            f"  {profile:<6} mean {seconds.mean():8.0f} ms  p50 {np.median(seconds):8.0f} ms"
+            f"  max {seconds.max():8.0f} ms",
+            file=file,
+        )
+    return latencies
+
+
+def write_results_jsonl(results: list[dict], f):
+    """One JSON line per question; retrieved chunks are reduced to id and distance."""
+    for state in results:
+        f.write(json.dumps({
+            "question": state["original_query"],
+            "rewritten_query": state["rewritten_query"],
+            "filters": state["filters"],
+            "retrieved_chunks": [
+                {"id": chunk["id"], "distance": chunk["distance"]} for chunk in state["retrieved_chunks"]
+            ],
+            "knowledge_analysis": state["knowledge_analysis"],
+            "final_response": state["final_response"],
+            "cached_question": state["cached_question"] or None,
+            "error": state.get("error"),
+        }) + "\n")
+
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        question = " ".join(sys.argv[1:])
+    parser = argparse.ArgumentParser(description="Ask the maintenance knowledge system a question.")
+    parser.add_argument("question", nargs="*", help="Question to ask (prompted for when omitted).")
+    parser.add_argument(
+        "--questions",
+        help="Text file with one question per line; runs them as a batch and writes JSONL results.",
+    )
+    parser.add_argument("--output", help="JSONL results file for --questions (default: stdout).")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help=f"Concurrent Claude calls for --questions (default: {LLM_CONCURRENCY}), "
+        f"or questions in flight with --async (default: {ASYNC_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Run --questions on one event loop with the async Claude client instead of a thread pool.",
+    )
+    parser.add_argument(
+        "--warm-up",
+        action="store_true",
+        help="Load the embedder, vector store and Claude client in parallel before asking.",
+    )
+    parser.add_argument("--timings", action="store_true", help="Print an import/warm-up/first-query latency report.")
+    parser.add_argument(
+        "--profile",
+        choices=PIPELINE_PROFILES,
+        default=PIPELINE_PROFILE,
+        help="Pipeline profile: 'full' rewrites, analyses and responds in separate Claude calls; "
+        f"'fast' answers in one combined call (default: {PIPELINE_PROFILE}).",
+    )
+    parser.add_argument(
+        "--compare-profiles",
+        action="store_true",
+        help="Time the question(s) under every pipeline profile, bypassing the caches, and print the latencies.",
+    )
+    parser.add_argument(
+        "--no-stream",
+        dest="stream",
+        action="store_false",
+        help="Print the analysis and response once complete instead of streaming tokens.",
+    )
+    args = parser.parse_args()
+
+    warm_up_seconds = warm_up() if args.warm_up else None
+
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        if args.compare_profiles:
+            compare_profiles(questions)
+            sys.exit(0)
+        query_start = time.perf_counter()
+        if args.use_async:
+            results = asyncio.run(arun_queries(questions, args.concurrency or ASYNC_CONCURRENCY, args.profile))
+        else:
+            results = run_queries(questions, args.concurrency or LLM_CONCURRENCY, args.profile)
+        query_seconds = time.perf_counter() - query_start
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as out:
+                write_results_jsonl(results, out)
+        else:
+            write_results_jsonl(results, sys.stdout)
+        failed = sum(1 for state in results if state.get("error"))
+        print(f"Answered {len(results) - failed}/{len(results)} questions.", file=sys.stderr)
+        if LLM_CACHE:
+            llm_stats = get_llm_cache().stats()
+            print(f"Claude call cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses.", file=sys.stderr)
+        print(token_usage_summary(), file=sys.stderr)
+        if args.timings:
+            report_startup(warm_up_seconds, query_seconds, file=sys.stderr)
+        sys.exit(0)
+
+    if args.question:
+        question = " ".join(args.question)
     else:
         question = input("Ask a maintenance question: ")
 
+    if args.compare_profiles:
+        compare_profiles([question])
+        sys.exit(0)
+
     print("\n" + "=" * 70)
     print("MAINTENANCE KNOWLEDGE SYSTEM")
     print("=" * 70)
     print(f"\nQuestion: {question}")
     print("-" * 70)
 
-    app = build_graph()
-    result = app.invoke({
-        "original_query": question,
-        "rewritten_query": "",
-        "retrieved_chunks": [],
-        "knowledge_analysis": "",
-        "final_response": "",
-    })
+    def print_retrieval(result):
+        if result.get("cached_question"):
+            print(f"\nAnswered from cache (similar to: {result['cached_question']})")
+        print(f"\nRewritten query: {result['rewritten_query'] or '(skipped)'}")
+        requested = {} if result.get("cached_question") else extract_filters(question) or {}
+        if result.get("filters") or requested:
+            print(f"Metadata filters: {json.dumps(result['filters'])}")
+            if result.get("filters") != requested:
+                print(f"  (relaxed from {json.dumps(requested)}, which matched nothing)")
+        print(f"\nChunks retrieved: {len(result['retrieved_chunks'])}")
+        _, kept = build_context(result["retrieved_chunks"], CONTEXT_TOKEN_BUDGET)
+        if kept < len(result["retrieved_chunks"]):
+            print(f"Context budget: analysing the top {kept}")
+        print("-" * 70)
 
-    print(f"\nRewritten query: {result['rewritten_query']}")
-    print(f"\nChunks retrieved: {len(result['retrieved_chunks'])}")
-    print("-" * 70)
-    print("\nKNOWLEDGE ANALYSIS:")
-    print(result["knowledge_analysis"])
-    print("-" * 70)
-    print("\nRESPONSE TO ENGINEER:")
-    print(result["final_response"])
+    headings = {"knowledge_extraction": "KNOWLEDGE ANALYSIS:", "response_synthesis": "RESPONSE TO ENGINEER:"}
+    streamed = []
+    result = initial_state(question)
+
+    def on_token(stage: str, text: str):
+        # Retrieval has finished by the time the first analysis token arrives
+        if not streamed or streamed[-1] != stage:
+            if streamed:
+                print("\n" + "-" * 70)
+            else:
+                print_retrieval(result)
+            print(f"\n{headings[stage]}")
+            streamed.append(stage)
+        print(text, end="", flush=True)
+
+    query_start = time.perf_counter()
+    app = build_graph(profile=args.profile)
+    config = {"configurable": {"on_token": on_token}} if args.stream else {}
+    for result in app.stream(initial_state(question), config, stream_mode="values"):
+        pass
+    query_seconds = time.perf_counter() - query_start
+
+    if streamed:
+        print()
+    else:
+        print_retrieval(result)
+        print("\nKNOWLEDGE ANALYSIS:")
+        print(result["knowledge_analysis"])
+        print("-" * 70)
+        print("\nRESPONSE TO ENGINEER:")
+        print(result["final_response"])
     print("=" * 70)
+    cache_stats = get_query_cache().stats()
+    print(f"Query embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if ANSWER_CACHE:
+        answer_stats = get_answer_cache(args.profile).stats()
+        print(f"Answer cache: {answer_stats['hits']} hits, {answer_stats['misses']} misses, {answer_stats['size']} stored")
+    if LLM_CACHE:
+        llm_stats = get_llm_cache().stats()
+        print(f"Claude call cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses ({llm_stats['hit_rate']:.0%} hit rate)")
+    print(token_usage_summary())
+    if args.timings:
+        report_startup(warm_up_seconds, query_seconds)
@@ -0,0 +1,154 @@
+import re
+from datetime import date
+
+# ---------------------------------------------------------------------------
+# Phrase → metadata value tables
+# ---------------------------------------------------------------------------
+EQUIPMENT_ALIASES = {
+    "Heavy Utility Truck": ["heavy utility truck", "utility truck"],
+    "Cargo Transport Truck": ["cargo transport truck", "cargo truck", "cargo transport"],
+    "Fuel Tanker Truck": ["fuel tanker", "tanker"],
+    "Armoured Personnel Carrier": ["armoured personnel carrier", "armored personnel carrier", "personnel carrier", "apc"],
+    "Armoured Reconnaissance Vehicle": ["reconnaissance vehicle", "recon vehicle", "recce vehicle"],
+    "Mine-Resistant Ambush Protected Vehicle": ["mine-resistant", "mine resistant", "mrap"],
+    "Recovery Vehicle": ["recovery vehicle", "wrecker"],
+    "Infantry Fighting Vehicle": ["infantry fighting vehicle", "ifv"],
+}
+
+CHUNK_TYPE_PATTERNS = {
+    "diagnostic": r"\bdiagnos(?:tic|is)\s+(?:steps?|procedures?|process)\b",
+    "resolution": r"\b(?:root\s+causes?|resolutions?|parts\s+replaced)\b",
+    "engineer_notes": r"\b(?:engineer(?:'?s)?\s+notes?|lessons\s+learned)\b",
+    "fault_overview": r"\bsymptoms?\b",
+}
+
+SEVERITIES = ("low", "medium", "high", "critical")
+_SEVERITY_RE = re.compile(
+    r"\b(critical|high|medium|low)(?:[- ]severity|[- ]priority)?\s+"
+    r"(?:faults?|issues?|failures?|problems?|defects?|only|severity)\b"
+    r"|\bseverity\s+(?:of\s+|is\s+|=\s*)?(critical|high|medium|low)\b"
+)
+
+_MONTHS = {
+    name: number
+    for number, names in enumerate(
+        [("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"),
+         ("may",), ("jun", "june"), ("jul", "july"), ("aug", "august"),
+         ("sep", "sept", "september"), ("oct", "october"), ("nov", "november"), ("dec", "december")],
+        start=1,
+    )
+    for name in names
+}
+# A 19xx/20xx year that isn't a reading: "before 1500 hours", "from 2000 rpm"
+# and "from 2000 to 2500" are left alone
+_YEAR = (
+    r"((?:19|20)\d{2})\b"
+    r"(?!\s*(?:-|–|to\s+\d|[.,]\d|%|°)"
+    r"|\s*(?:rpm|revs?|hours?|hrs?|h|mins?|minutes?|secs?|seconds?|km|kms|kilometres?|kilometers?"
+    r"|miles?|mi|psi|bar|kpa|nm|kg|lbs?|degrees?|volts?|amps?|litres?|liters?|l|gal|gallons?)\b)"
+)
+_DATE_RE = re.compile(
+    r"\b(since|after|from|before|until|in|during)\s+"
+    r"(" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\b\.?(?:\s+" + _YEAR + r")?"
+    r"|\b(since|after|from|before|until|in|during)\s+" + _YEAR
+)
+
+
+def date_int(iso_date: str) -> int:
+    """'2024-03-15' → 20240315, the numeric form ChromaDB range filters need."""
+    return int(iso_date.replace("-", ""))
+
+
+def _month_range(year: int, month: int) -> tuple[int, int]:
+    start = year * 10000 + month * 100 + 1
+    end = year * 10000 + month * 100 + 31
+    return start, end
+
+
+def _date_condition(text: str, today: date) -> dict | None:
+    match = _DATE_RE.search(text)
+    if match is None:
+        return None
+
+    if match.group(1):
+        keyword, month, year = match.group(1), _MONTHS[match.group(2)], match.group(3)
+        if year is None:
+            # A bare month means its most recent occurrence, not one in the future
+            year = today.year if month <= today.month else today.year - 1
+        start, end = _month_range(int(year), month)
+    else:
+        keyword, year = match.group(4), int(match.group(5))
+        start, end = year * 10000 + 101, year * 10000 + 1231
+
+    if keyword in ("since", "from"):
+        return {"date_int": {"$gte": start}}
+    if keyword == "after":
+        return {"date_int": {"$gt": end}}
+    if keyword == "before":
+        return {"date_int": {"$lt": start}}
+    if keyword == "until":
+        return {"date_int": {"$lte": end}}
+    return {"$and": [{"date_int": {"$gte": start}}, {"date_int": {"$lte": end}}]}
+
+
+def _is_date_range(condition: dict) -> bool:
+    return list(condition) == ["$and"] and all(list(part) == ["date_int"] for part in condition["$and"])
+
+
+def split_conditions(where: dict | None) -> list[dict]:
+    """Top-level conditions of a filter built by `extract_filters`. A month or
+    year range is one condition even though it is itself an `$and`."""
+    if not where:
+        return []
+    if "$and" in where and not _is_date_range(where):
+        return list(where["$and"])
+    return [where]
+
+
+def join_conditions(conditions: list[dict]) -> dict | None:
+    """Inverse of `split_conditions`."""
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def _one_of(field: str, values: list[str]) -> dict:
+    return {field: values[0]} if len(values) == 1 else {field: {"$in": values}}
+
+
+def extract_filters(question: str, today: date | None = None) -> dict | None:
+    """Pull structured metadata filters out of a plain-language question.
+
+    Recognises equipment types ("on the fuel tanker"), severities ("critical
+    faults only"), date ranges ("since March", "in 2024") and chunk types
+    ("diagnostic steps for ..."). Returns a ChromaDB `where` clause, or None
+    when the question names no filter.
+    """
+    text = question.lower()
+    today = today or date.today()
+    conditions = []
+
+    equipment = [
+        equipment_type
+        for equipment_type, aliases in EQUIPMENT_ALIASES.items()
+        if any(re.search(rf"\b{re.escape(alias)}s?\b", text) for alias in aliases)
+    ]
+    if equipment:
+        conditions.append(_one_of("equipment_type", equipment))
+
+    severities = sorted(
+        {m.group(1) or m.group(2) for m in _SEVERITY_RE.finditer(text)},
+        key=SEVERITIES.index,
+    )
+    if severities:
+        conditions.append(_one_of("severity", severities))
+
+    date_condition = _date_condition(text, today)
+    if date_condition:
+        conditions.append(date_condition)
+
+    chunk_types = [name for name, pattern in CHUNK_TYPE_PATTERNS.items() if re.search(pattern, text)]
+    if chunk_types:
+        conditions.append(_one_of("chunk_type", chunk_types))
+
+    return join_conditions(conditions)
@@ -0,0 +1,55 @@
+import numpy as np
+
+
+def mmr_select(
+    embeddings: np.ndarray,
+    relevance: np.ndarray,
+    k: int,
+    mmr_lambda: float = 1.0,
+    groups: list[str] | None = None,
+    max_per_group: int | None = None,
+    max_similarity: float | None = None,
+) -> list[int]:
+    """Greedy maximal marginal relevance over a candidate pool.
+
+    Each step picks the candidate maximising
+    `mmr_lambda * relevance - (1 - mmr_lambda) * max cosine similarity to
+    the picks so far`, so `mmr_lambda=1` keeps plain relevance order.
+    Candidates whose group (e.g. log id) already has `max_per_group` picks,
+    or that are more similar than `max_similarity` to an earlier pick, are
+    skipped; fewer than `k` indices come back when the pool runs out.
+
+    `embeddings` must be unit-normalised rows. Each step is one
+    matrix-vector product, so the cost is O(k · n · dim).
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    relevance = np.asarray(relevance, dtype=np.float32)
+
+    available = np.ones(n, dtype=bool)
+    redundancy = np.full(n, -np.inf, dtype=np.float32)  # max similarity to any pick
+    if groups is not None and max_per_group is not None:
+        _, group_codes = np.unique(np.asarray(groups), return_inverse=True)
+        group_counts = np.zeros(group_codes.max() + 1, dtype=np.int64)
+    else:
+        group_codes = None
+
+    picks = []
+    while len(picks) < k and available.any():
+        penalty = np.maximum(redundancy, 0.0) if picks else 0.0
+        scores = mmr_lambda * relevance - (1.0 - mmr_lambda) * penalty
+        best = int(np.argmax(np.where(available, scores, -np.inf)))
+        picks.append(best)
+        available[best] = False
+
+        redundancy = np.maximum(redundancy, embeddings @ embeddings[best])
+        if max_similarity is not None:
+            available &= redundancy < max_similarity
+        if group_codes is not None:
+            group = group_codes[best]
+            group_counts[group] += 1
+            if group_counts[group] >= max_per_group:
+                available &= group_codes != group
+    return picks
@@ -0,0 +1,205 @@
+import json
+import os
+import uuid
+from typing import Protocol
+
+import numpy as np
+
+from embedding_sidecar import load_sidecar
+
+CHUNK_STORE_FILE = "chunks.jsonl"  # id/text/metadata per chunk, written by ingest into VECTORSTORE_PATH
+COLLECTION_VERSION_FILE = "collection_version"  # changes whenever ingest changes the stored chunks
+
+_COMPARISONS = {
+    "$eq": np.equal,
+    "$ne": np.not_equal,
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+def read_collection_version(vectorstore_path: str) -> str:
+    """Opaque token identifying the current contents of the vector store."""
+    try:
+        with open(os.path.join(vectorstore_path, COLLECTION_VERSION_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_collection_version(vectorstore_path: str) -> str:
+    version = uuid.uuid4().hex
+    path = os.path.join(vectorstore_path, COLLECTION_VERSION_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(path + ".tmp", path)
+    return version
+
+
+class VectorStore(Protocol):
+    """The slice of the ChromaDB Collection API the pipeline relies on.
+
+    A chromadb Collection satisfies it as-is; `NumpyVectorStore` is the
+    in-process alternative.
+    """
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict | None = None, include=None) -> dict: ...
+
+    def get(self, ids=None, where: dict | None = None, limit: int | None = None, offset: int | None = None,
+            include=None) -> dict: ...
+
+    def count(self) -> int: ...
+
+
+class NumpyVectorStore:
+    """Exact nearest-neighbour search over an in-memory float32 matrix.
+
+    Embeddings come from the ingest sidecar and are copied into one
+    contiguous matrix; documents and metadata come from the chunk store and
+    are held column-wise so `where` filters evaluate as vectorised masks.
+    Distances are squared L2, matching ChromaDB's default space, and results
+    have the same shape as `Collection.query` / `Collection.get`.
+    """
+
+    def __init__(self, chunk_store_path: str, sidecar_path: str):
+        matrix, index = load_sidecar(sidecar_path)
+
+        self.ids: list[str] = []
+        self.documents: list[str] = []
+        self.metadatas: list[dict] = []
+        rows = []
+        with open(chunk_store_path, "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                entry = index.get(chunk["id"])
+                if entry is None or entry[1] != chunk["metadata"].get("content_hash"):
+                    raise ValueError(f"Embedding sidecar is missing or stale for chunk '{chunk['id']}'. Re-run ingest.py.")
+                self.ids.append(chunk["id"])
+                self.documents.append(chunk["text"])
+                self.metadatas.append(chunk["metadata"])
+                rows.append(entry[0])
+
+        self.embeddings = np.ascontiguousarray(matrix[rows], dtype=np.float32)
+        self._sq_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+        self._id_rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self._columns = self._build_columns(self.metadatas)
+
+    @staticmethod
+    def _build_columns(metadatas: list[dict]) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """Column-wise metadata: field → (values, present mask). Numeric fields
+        become float arrays, everything else object arrays of str, so filter
+        values are never truncated to a fixed width."""
+        fields = {key for meta in metadatas for key in meta}
+        columns = {}
+        for field in fields:
+            values = [meta.get(field) for meta in metadatas]
+            present = np.array([value is not None for value in values])
+            if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values if v is not None):
+                column = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            else:
+                column = np.array(["" if v is None else str(v) for v in values], dtype=object)
+            columns[field] = (column, present)
+        return columns
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    # -- filtering -----------------------------------------------------------
+    def _mask(self, where: dict | None) -> np.ndarray:
+        if not where:
+            return np.ones(len(self.ids), dtype=bool)
+        masks = []
+        for key, condition in where.items():
+            if key == "$and":
+                masks.append(np.logical_and.reduce([self._mask(c) for c in condition]))
+            elif key == "$or":
+                masks.append(np.logical_or.reduce([self._mask(c) for c in condition]))
+            else:
+                masks.append(self._field_mask(key, condition))
+        return np.logical_and.reduce(masks)
+
+    def _field_mask(self, field: str, condition) -> np.ndarray:
+        if field not in self._columns:
+            return np.zeros(len(self.ids), dtype=bool)
+        column, present = self._columns[field]
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+
+        numeric = column.dtype != object
+
+        def fits(value) -> bool:
+            if numeric:
+                return isinstance(value, (int, float)) and not isinstance(value, bool)
+            return isinstance(value, str)
+
+        mask = present.copy()
+        nothing = np.zeros(len(self.ids), dtype=bool)
+        for op, value in condition.items():
+            if op in ("$in", "$nin"):
+                # Values of the wrong type can never be equal to the column's
+                values = [v for v in value if fits(v)]
+                hits = np.isin(column, np.array(values, dtype=column.dtype)) if values else nothing
+                mask &= hits if op == "$in" else ~hits
+            elif op in ("$eq", "$ne"):
+                hits = _COMPARISONS["$eq"](column, value) if fits(value) else nothing
+                mask &= hits if op == "$eq" else ~hits
+            elif op in _COMPARISONS:
+                if not (numeric and fits(value)):
+                    raise ValueError(f"'{op}' needs a numeric field and value, got {field}={value!r}.")
+                mask &= _COMPARISONS[op](column, value)
+            else:
+                raise ValueError(f"Unsupported where operator '{op}'.")
+        return mask
+
+    # -- Collection API ------------------------------------------------------
+    def query(self, query_embeddings, n_results: int = 10, where: dict | None = None, include=None) -> dict:
+        include = include or ["documents", "metadatas", "distances"]
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.embeddings.shape[1])
+
+        # ||e - q||² = ||e||² - 2 e·q + ||q||², for every query at once
+        distances = self._sq_norms[None, :] - 2.0 * (queries @ self.embeddings.T)
+        distances += np.einsum("ij,ij->i", queries, queries)[:, None]
+
+        candidates = np.flatnonzero(self._mask(where))
+        k = min(n_results, len(candidates))
+        if k == 0:
+            top = np.empty((len(queries), 0), dtype=np.int64)
+        else:
+            scoped = distances[:, candidates]
+            part = np.argpartition(scoped, k - 1, axis=1)[:, :k]
+            order = np.take_along_axis(scoped, part, axis=1).argsort(axis=1)
+            top = candidates[np.take_along_axis(part, order, axis=1)]
+
+        result = {"ids": [[self.ids[i] for i in row] for row in top]}
+        if "documents" in include:
+            result["documents"] = [[self.documents[i] for i in row] for row in top]
+        if "metadatas" in include:
+            result["metadatas"] = [[self.metadatas[i] for i in row] for row in top]
+        if "distances" in include:
+            result["distances"] = [np.take(distances[q], row).tolist() for q, row in enumerate(top)]
+        if "embeddings" in include:
+            result["embeddings"] = [self.embeddings[row] for row in top]
+        return result
+
+    def get(self, ids=None, where: dict | None = None, limit: int | None = None, offset: int | None = None,
+            include=None) -> dict:
+        include = include or ["documents", "metadatas"]
+        if ids is None:
+            rows = np.arange(len(self.ids))
+        else:
+            rows = np.array([self._id_rows[i] for i in ids if i in self._id_rows], dtype=np.int64)
+        if where:
+            rows = rows[self._mask(where)[rows]]
+        start = offset or 0
+        rows = rows[start : start + limit if limit is not None else None]
+
+        result = {"ids": [self.ids[i] for i in rows]}
+        if "documents" in include:
+            result["documents"] = [self.documents[i] for i in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[i] for i in rows]
+        if "embeddings" in include:
+            result["embeddings"] = self.embeddings[rows]
+        return result